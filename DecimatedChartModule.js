@@ -0,0 +1,72 @@
+// A line chart fed by visualization.DecimatedChartModule, which sends the
+// rows not sent yet. The chart is redrawn at most once per min_interval
+// milliseconds, always after the last rows arrive. Once a series holds more
+// than max_points points, every other point is dropped, so redraws stay cheap.
+var DecimatedChartModule = function(series, canvas_width, canvas_height, max_points, min_interval) {
+    var canvas = $("<canvas width='" + canvas_width + "' height='" + canvas_height + "' " +
+                   "style='border:1px dotted'></canvas>")[0];
+    $("#elements").append(canvas);
+    var context = canvas.getContext("2d");
+
+    var datasets = [];
+    for (var i in series) {
+        datasets.push({label: series[i].Label, borderColor: series[i].Color, fill: false, data: []});
+    }
+    var chart = new Chart(context, {
+        type: "line",
+        data: {labels: [], datasets: datasets},
+        options: {
+            responsive: true,
+            animation: false,
+            elements: {point: {radius: 0}},
+            tooltips: {mode: "index", intersect: false},
+            scales: {xAxes: [{display: true, ticks: {maxTicksLimit: 11}}], yAxes: [{display: true}]}
+        }
+    });
+
+    var lastDraw = 0;
+    var pending = null;
+    var draw = function() {
+        pending = null;
+        lastDraw = Date.now();
+        chart.update();
+    };
+
+    var halve = function(list) {
+        var kept = [];
+        for (var j = 0; j < list.length; j += 2) {
+            kept.push(list[j]);
+        }
+        return kept;
+    };
+
+    this.render = function(data) {
+        if (data === null) {
+            return;
+        }
+        var rows = data.series.length ? data.series[0].length : 0;
+        for (var j = 0; j < rows; j++) {
+            chart.data.labels.push(data.start + j + 1);
+        }
+        for (var k = 0; k < data.series.length; k++) {
+            Array.prototype.push.apply(chart.data.datasets[k].data, data.series[k]);
+        }
+        if (chart.data.labels.length > max_points) {
+            chart.data.labels = halve(chart.data.labels);
+            chart.data.datasets.forEach(function(dataset) { dataset.data = halve(dataset.data); });
+        }
+        var wait = lastDraw + min_interval - Date.now();
+        if (wait <= 0) {
+            draw();
+        } else if (pending === null) {
+            pending = setTimeout(draw, wait);
+        }
+    };
+
+    this.reset = function() {
+        chart.data.labels = [];
+        chart.data.datasets.forEach(function(dataset) { dataset.data = []; });
+        clearTimeout(pending);
+        draw();
+    };
+};
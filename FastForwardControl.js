@@ -0,0 +1,68 @@
+// Controls for fastforward.FastForwardServer: advance the model several
+// steps on the server without rendering them, with a progress bar.
+var FastForwardControl = function(steps) {
+    var panel = $([
+        "<div class='form-inline' style='margin-bottom: 10px'>",
+        "<input type='number' class='form-control' min='1' value='" + steps + "' style='width: 100px'/> ",
+        "<label><input type='checkbox'/> until the allele frequency converges</label> ",
+        "<button type='button' class='btn btn-default'>Fast forward</button>",
+        "<div class='progress' style='margin: 5px 0 0 0'>",
+        "<div class='progress-bar' role='progressbar' style='width: 0%'></div>",
+        "</div>",
+        "</div>"
+    ].join(""));
+    $("#elements").append(panel);
+    var input = panel.find("input[type=number]");
+    var converge = panel.find("input[type=checkbox]");
+    var button = panel.find("button");
+    var bar = panel.find(".progress-bar");
+    var running = false;
+
+    var finish = function(msg) {
+        running = false;
+        button.text("Fast forward");
+        bar.css("width", "100%");
+        if (msg.error !== undefined) {
+            bar.text("Failed: " + msg.error);
+            return;
+        }
+        control.tick += msg.steps;
+        stepDisplay.innerText = control.tick;
+        bar.text(msg.steps + " steps" + (msg.converged ? ", converged" : ""));
+    };
+
+    button.click(function() {
+        if (running) {
+            send({type: "fast_forward_cancel"});
+            return;
+        }
+        if (control.finished) {
+            return;
+        }
+        control.stop();
+        running = true;
+        button.text("Cancel");
+        bar.css("width", "0%").text("");
+        send({type: "fast_forward", steps: Number(input.val()), until_converged: converge.is(":checked")});
+    });
+
+    // Progress and completion messages are handled here; all others as before
+    var onmessage = ws.onmessage;
+    ws.onmessage = function(message) {
+        var msg = JSON.parse(message.data);
+        if (msg.type === "fast_forward_progress") {
+            bar.css("width", (100 * msg.done / msg.steps) + "%");
+            bar.text(msg.done + " / " + msg.steps + " (allele frequency " + msg.frequency.toFixed(4) + ")");
+        } else if (msg.type === "fast_forward_done") {
+            finish(msg);
+        } else {
+            onmessage(message);
+        }
+    };
+
+    this.render = function(data) {};
+
+    this.reset = function() {
+        bar.css("width", "0%").text("");
+    };
+};
@@ -0,0 +1,100 @@
+// Draws the frames sent by visualization.RasterGrid: a PNG key frame of
+// one byte per cell, or the indices and values of the cells that changed.
+var RasterGrid = function(canvas_width, canvas_height) {
+    var canvas = $("<canvas width='" + canvas_width + "' height='" + canvas_height + "' " +
+                   "style='border:1px dotted; image-rendering: pixelated'></canvas>")[0];
+    $("#elements").append(canvas);
+    var context = canvas.getContext("2d");
+
+    // Adult colors of normal, carrier and sickle, as in the agent portrayal
+    var colors = [[0x16, 0x98, 0x1C], [0xCC, 0xCF, 0x02], [0xFF, 0x13, 0x0F]];
+    var levels = 85;
+    var values = null;
+    var raster = document.createElement("canvas");
+    var image = null;
+    // Key frames decode asynchronously, so frames are applied in order on a chain
+    var pending = Promise.resolve();
+
+    var paint = function(i) {
+        var value = values[i];
+        var pixel = 4 * i;
+        if (value === 0) {
+            image.data[pixel + 3] = 0;
+            return;
+        }
+        var color = colors[Math.floor((value - 1) / levels)];
+        var count = (value - 1) % levels + 1;
+        image.data[pixel] = color[0];
+        image.data[pixel + 1] = color[1];
+        image.data[pixel + 2] = color[2];
+        image.data[pixel + 3] = 80 + Math.round(175 * Math.min(count, 10) / 10);
+    };
+
+    var draw = function() {
+        raster.getContext("2d").putImageData(image, 0, 0);
+        context.clearRect(0, 0, canvas.width, canvas.height);
+        context.imageSmoothingEnabled = false;
+        context.drawImage(raster, 0, 0, canvas.width, canvas.height);
+    };
+
+    var decode = function(text) {
+        var binary = atob(text);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return bytes;
+    };
+
+    var keyFrame = function(png) {
+        return new Promise(function(resolve) {
+            var img = new Image();
+            img.onload = function() {
+                raster.width = img.width;
+                raster.height = img.height;
+                var rasterContext = raster.getContext("2d");
+                rasterContext.drawImage(img, 0, 0);
+                var gray = rasterContext.getImageData(0, 0, img.width, img.height).data;
+                values = new Uint8Array(img.width * img.height);
+                image = rasterContext.createImageData(img.width, img.height);
+                for (var i = 0; i < values.length; i++) {
+                    values[i] = gray[4 * i];
+                    paint(i);
+                }
+                draw();
+                resolve();
+            };
+            img.src = "data:image/png;base64," + png;
+        });
+    };
+
+    var diff = function(data) {
+        if (values === null) {
+            return;
+        }
+        var index = new Uint32Array(decode(data.index).buffer);
+        var changed = decode(data.values);
+        for (var j = 0; j < index.length; j++) {
+            values[index[j]] = changed[j];
+            paint(index[j]);
+        }
+        draw();
+    };
+
+    this.render = function(data) {
+        if (data === null) {
+            return;
+        }
+        if (data.png !== undefined) {
+            levels = data.density_levels;
+            pending = pending.then(function() { return keyFrame(data.png); });
+        } else {
+            pending = pending.then(function() { diff(data); });
+        }
+    };
+
+    this.reset = function() {
+        values = null;
+        context.clearRect(0, 0, canvas.width, canvas.height);
+    };
+};
@@ -1,155 +1,100 @@
-from random_walk import RandomWalker
+from collections import namedtuple
 
+# Genotype codes: number of sickle alleles
+NORMAL = 0
+CARRIER = 1
+SICKLE = 2
 
-class Adult(RandomWalker):
-    """
-    A sheep that walks around, reproduces (asexually) and gets eaten.
-    The init is the same as the RandomWalker.
-    """
-    genotype = None
-    age = 20
-
-    def __init__(self, unique_id, pos, model, moore, genotype = None, age = 20):
-        super().__init__(unique_id, pos, model, moore=moore)
-        self.genotype = genotype
-        self.life_expectancy = 90
-        self.age = age
-
-    def step(self):
-        """
-        A model step. Move, then eat grass and reproduce.
-        """
-        self.random_move()
-        living = True
-
-        # Reduce energy
-        self.age += 1
-
-        # Death
-        #if self.age > self.life_expectancy:
-                #self.model.grid._remove_agent(self.pos, self)
-                #self.model.schedule.remove(self)
-                #living = False
-
+# Life stages
+CHILD = 0
+ADULT = 1
 
-class AdultSickle(Adult):
+MATURATION = 5
 
-    genotype = None
 
-    def __init__(self, unique_id, pos, model, moore, genotype, age = None):
-        super().__init__(unique_id,pos, model, moore=moore, genotype=1.0, age = 20)
-        self.genotype = genotype
-        self.age = age
-
-    def step(self):
-        super().step()
+def _get_age(person):
+    if person.birth is None:
+        return None
+    return person.model.schedule.steps - person.birth
 
 
-class AdultCarrier(Adult):
-
-    def __init__(self, unique_id, pos, model, moore, genotype, age = None):
-        super().__init__(unique_id, pos, model, moore=moore, genotype=0.5, age = 20)
-        self.genotype = genotype
-        self.age = age
+def _set_age(person, age):
+    person.birth = None if age is None else person.model.schedule.steps - age
 
-    def step(self):
-        super().step()
-
-
-class AdultNormal(Adult):
-
-    def __init__(self, unique_id, pos, model, moore, genotype, age = None):
-        super().__init__(unique_id, pos, model, moore=moore, genotype = 0, age = 20)
-        self.genotype = genotype
-        self.age = age
 
-    def step(self):
-        super().step()
-
-
-class Child(RandomWalker):
+class Breed(namedtuple("Breed", ["genotype", "stage", "name"])):
     """
-    A wolf that walks around, reproduces (asexually) and eats sheep.
+    One of the six genotype and life stage combinations the model counts.
+    Breeds are keys, not agent classes: every person is a Person, and its
+    breed follows from its genotype and stage fields.
     """
+    __slots__ = ()
 
-    genotype = None
-    age = None
-
-    def __init__(self, unique_id, pos, model, moore, genotype=None, age=None):
-        super().__init__(unique_id, pos, model, moore=moore)
-        self.genotype = genotype
-        self.maturation = 5
-        self.age = age
-
+    @property
+    def adult_breed(self):
+        """
+        The breed a child of this breed matures into.
+        """
+        return BREED_LIST[3 * ADULT + self.genotype]
 
-class ChildSickle(Child):
+    def __repr__(self):
+        return self.name
 
-    genotype = None
-    age = None
 
-    def __init__(self, unique_id, pos, model, moore, genotype=None, age=None):
-        super().__init__(unique_id, pos, model, moore=moore, genotype=1.0, age=None)
-        self.genotype = genotype
-        self.maturation = 5
-        self.age = age
+ChildNormal = Breed(NORMAL, CHILD, "ChildNormal")
+ChildCarrier = Breed(CARRIER, CHILD, "ChildCarrier")
+ChildSickle = Breed(SICKLE, CHILD, "ChildSickle")
+AdultNormal = Breed(NORMAL, ADULT, "AdultNormal")
+AdultCarrier = Breed(CARRIER, ADULT, "AdultCarrier")
+AdultSickle = Breed(SICKLE, ADULT, "AdultSickle")
 
-    def step(self):
-        self.random_move()
-        self.age += 1
+# Indexed by 3 * stage + genotype
+BREED_LIST = (ChildNormal, ChildCarrier, ChildSickle, AdultNormal, AdultCarrier, AdultSickle)
 
-        if self.age >=5:
-            teen = AdultSickle(
-                self.model.next_id(), self.pos ,self.model, self.moore, self.genotype, age=5
-            )
-            self.model.grid.place_agent(teen, teen.pos)
-            self.model.schedule.add(teen)
-            self.model.grid._remove_agent(self.pos, self)
-            self.model.schedule.remove(self)
 
+class Person:
+    """
+    A person on the grid. Provides the parts of Mesa's Agent interface the
+    model uses (unique_id, model, pos and random), but stores only six
+    slots and no __dict__, so that large populations stay small in memory.
+    Genotype and life stage are small ints, and the age is kept as the step
+    of birth so the whole population ages without touching any person.
+    People have no step of their own; the scheduler moves everyone at once.
+    """
 
-class ChildCarrier(Child):
-    genotype = None
-    age = None
+    __slots__ = ("unique_id", "model", "pos", "genotype", "stage", "birth")
+    moore = True
+    maturation = MATURATION
+    life_expectancy = 90
+    age = property(_get_age, _set_age)
 
-    def __init__(self, unique_id, pos, model, moore, genotype=None, age=None):
-        super().__init__(unique_id, pos, model, moore=moore, genotype=0.5, age=None)
+    def __init__(self, unique_id, pos, model, genotype, stage, age=0):
+        """
+        Args:
+            unique_id: Unique identifier of the person.
+            pos: (x, y) cell of the person.
+            model: The SickleSim the person lives in.
+            genotype: NORMAL, CARRIER or SICKLE.
+            stage: CHILD or ADULT.
+            age: Age in steps.
+        """
+        self.unique_id = unique_id
+        self.model = model
+        self.pos = pos
         self.genotype = genotype
-        self.maturation = 5
+        self.stage = stage
         self.age = age
 
-    def step(self):
-        self.random_move()
-        self.age += 1
-
-        if self.age >=5:
-            teen = AdultCarrier(
-                self.model.next_id(), self.pos ,self.model, self.moore, self.genotype, age=5
-            )
-            self.model.grid.place_agent(teen, teen.pos)
-            self.model.schedule.add(teen)
-            self.model.grid._remove_agent(self.pos, self)
-            self.model.schedule.remove(self)
-
+    @property
+    def random(self):
+        return self.model.random
 
-class ChildNormal(Child):
-    genotype = None
-    age = None
+    @property
+    def breed(self):
+        return BREED_LIST[3 * self.stage + self.genotype]
 
-    def __init__(self, unique_id, pos, model, moore, genotype=None, age=None):
-        super().__init__(unique_id, pos, model, moore=moore, genotype=0.0, age=None)
-        self.genotype = genotype
-        self.maturation = 5
-        self.age = age
-
-    def step(self):
-        self.random_move()
-        self.age += 1
-
-        if self.age >=5:
-            teen = AdultNormal(
-                self.model.next_id(), self.pos ,self.model, self.moore, self.genotype, age=5
-            )
-            self.model.grid.place_agent(teen, teen.pos)
-            self.model.schedule.add(teen)
-            self.model.grid._remove_agent(self.pos, self)
-            self.model.schedule.remove(self)
\ No newline at end of file
+    def mature(self):
+        """
+        Turn this child into an adult, keeping its identity and position.
+        """
+        self.stage = ADULT
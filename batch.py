@@ -0,0 +1,259 @@
+"""
+Headless parameter sweeps over SickleSim.
+
+Every combination of a parameter grid is run for a number of replicates in a
+pool of worker processes. Each run gets a seed derived from the sweep seed and
+its run id, so a sweep is reproducible no matter how runs are scheduled, and
+each finished run is written to the result store as soon as it arrives so that
+a crash never loses completed work. Rerunning a sweep into the same store only
+runs what is missing.
+
+Example:
+    python batch.py --param malaria_prevalence=0,0.5,1 \
+        --param heterozygous_advantage=0.25,0.75 --replicates 10 --out sweep
+"""
+
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from model import SickleSim
+
+
+def parameter_grid(**axes):
+    """
+    Returns the list of all combinations of the given parameter values.
+    Args:
+        axes: Parameter name -> list of values.
+    """
+    names = sorted(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def run_seed(seed, run_id):
+    """
+    Returns the deterministic model seed of one run of a sweep.
+    """
+    return int(np.random.SeedSequence([seed, run_id]).generate_state(1)[0])
+
+
+def run_once(params, step_count, seed, tolerance=None, window=20, cache=None):
+    """
+    Run a single SickleSim headless and return its collected model data.
+    With a tolerance, the run stops at equilibrium (see SickleSim.run_model)
+    and its step is stored in an "equilibrium_step" column, empty if the run
+    did not converge. With a cache directory, a cached run is returned
+    without being recomputed.
+    """
+    model = SickleSim(seed=seed, **params)
+    equilibrium = model.run_model(step_count, tolerance=tolerance, window=window, cache=cache)
+    frame = model.datacollector.get_model_vars_dataframe()
+    if tolerance is not None:
+        frame["equilibrium_step"] = np.nan if equilibrium is None else equilibrium["step"]
+    return frame
+
+
+class ResultStore:
+    """
+    A directory holding one CSV file per finished run, plus a manifest of
+    the sweep they belong to. Files are written atomically, so a run is
+    either fully stored or not stored at all.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, run_id):
+        return os.path.join(self.path, "run_{:06d}.csv".format(run_id))
+
+    def claim(self, sweep):
+        """
+        Record the sweep this store holds, or check that it is the one
+        already recorded, since runs are only identified by their index in
+        the sweep.
+        Args:
+            sweep: JSON-serializable description of the sweep.
+        Raises:
+            ValueError: If the store holds runs of another sweep.
+        """
+        manifest = os.path.join(self.path, "manifest.json")
+        sweep = json.loads(json.dumps(sweep))
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                if json.load(f) != sweep:
+                    raise ValueError("{} holds the results of a different sweep".format(self.path))
+            return
+        if any(name.endswith(".csv") for name in os.listdir(self.path)):
+            raise ValueError("{} holds results without a manifest".format(self.path))
+        with open(manifest + ".tmp", "w") as f:
+            json.dump(sweep, f, indent=1, sort_keys=True)
+        os.replace(manifest + ".tmp", manifest)
+
+    def __contains__(self, run_id):
+        return os.path.exists(self._file(run_id))
+
+    def save(self, run_id, frame):
+        tmp = self._file(run_id) + ".tmp"
+        frame.to_csv(tmp, index_label="Step")
+        os.replace(tmp, self._file(run_id))
+
+    def load(self):
+        """
+        Returns the data of all stored runs as one DataFrame.
+        """
+        files = sorted(name for name in os.listdir(self.path) if name.endswith(".csv"))
+        if not files:
+            return pd.DataFrame()
+        return pd.concat([pd.read_csv(os.path.join(self.path, name)) for name in files], ignore_index=True)
+
+
+def run_sweep(
+    grid,
+    store,
+    replicates=1,
+    step_count=200,
+    seed=0,
+    max_workers=None,
+    max_restarts=3,
+    tolerance=None,
+    window=20,
+    cache=None,
+    verbose=False,
+):
+    """
+    Run every parameter set of a grid for a number of replicates.
+    Args:
+        grid: List of SickleSim keyword argument dicts, e.g. from parameter_grid().
+        store: ResultStore (or directory path) that receives each finished run;
+               it must be new or hold an earlier attempt at the same sweep.
+        replicates: Number of runs per parameter set.
+        step_count: Number of steps per run.
+        seed: Sweep seed from which every run seed is derived.
+        max_workers: Number of worker processes, defaults to the CPU count.
+        max_restarts: How many times to rebuild the pool after a worker crash;
+                      after that, the remaining runs are run one at a time.
+        tolerance: If given, stop each run at equilibrium, so its worker
+                   moves on to the next run early; see run_once.
+        window: Number of steps the equilibrium has to hold.
+        cache: Directory of a ResultCache the runs are looked up in first.
+        verbose: Print progress.
+    After a worker crash, the runs that were in flight are retried one at
+    a time, and a run that crashes its worker again is recorded as failed.
+    Returns:
+        Dict of run_id -> exception for runs that raised or crashed their worker.
+    """
+    if not isinstance(store, ResultStore):
+        store = ResultStore(store)
+    store.claim({
+        "grid": grid, "replicates": replicates, "step_count": step_count, "seed": seed,
+        "tolerance": tolerance, "window": window,
+    })
+
+    runs = {}
+    for i, (params, replicate) in enumerate(itertools.product(grid, range(replicates))):
+        if i not in store:
+            runs[i] = (params, replicate, run_seed(seed, i))
+
+    def submit(pool, run_id):
+        params, replicate, model_seed = runs[run_id]
+        return pool.submit(run_once, params, step_count, model_seed, tolerance, window, cache)
+
+    def finish(run_id, frame):
+        params, replicate, model_seed = runs.pop(run_id)
+        for name, value in params.items():
+            frame[name] = value
+        frame["run_id"] = run_id
+        frame["replicate"] = replicate
+        frame["seed"] = model_seed
+        store.save(run_id, frame)
+        if verbose:
+            print("finished run {} ({} left)".format(run_id, len(runs)))
+
+    errors = {}
+    restarts = 0
+    while runs:
+        in_flight = set()
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = {submit(pool, run_id): run_id for run_id in runs}
+                pending = set(futures)
+                while pending:
+                    # The runs handed to workers, one of which killed its worker if the pool breaks
+                    in_flight = {futures[future] for future in pending if future.running()}
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        run_id = futures[future]
+                        try:
+                            frame = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            errors[run_id] = e
+                            del runs[run_id]
+                            continue
+                        finish(run_id, frame)
+        except BrokenProcessPool:
+            restarts += 1
+            suspects = [run_id for run_id in sorted(in_flight) if run_id in runs]
+            if not suspects or restarts > max_restarts:
+                suspects = list(runs)
+            if verbose:
+                print("worker crashed, retrying {} runs one at a time".format(len(suspects)))
+            # Alone in its own pool, a run that crashes again only fails itself
+            for run_id in suspects:
+                try:
+                    with ProcessPoolExecutor(max_workers=1) as pool:
+                        frame = submit(pool, run_id).result()
+                except Exception as e:
+                    errors[run_id] = e
+                    del runs[run_id]
+                    continue
+                finish(run_id, frame)
+    return errors
+
+
+def _parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a headless SickleSim parameter sweep.")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="Parameter axis of the grid; may be given several times.")
+    parser.add_argument("--replicates", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="sweep")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Stop each run once it is at equilibrium within this tolerance.")
+    parser.add_argument("--window", type=int, default=20,
+                        help="Number of steps the equilibrium has to hold.")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="Result cache directory runs are looked up in first and added to.")
+    args = parser.parse_args()
+
+    axes = {}
+    for param in args.param:
+        name, values = param.split("=", 1)
+        axes[name] = [_parse_value(value) for value in values.split(",")]
+
+    failed = run_sweep(
+        parameter_grid(**axes), args.out, replicates=args.replicates, step_count=args.steps,
+        seed=args.seed, max_workers=args.workers, tolerance=args.tolerance, window=args.window,
+        cache=args.cache, verbose=True,
+    )
+    for run_id, error in failed.items():
+        print("run {} failed: {!r}".format(run_id, error))
@@ -0,0 +1,157 @@
+"""
+Benchmarks for SickleSim initialization, stepping and the carrying-capacity
+cull across population and grid sizes.
+
+Every scenario runs in a fresh subprocess so its peak RSS is its own. Results
+are written as JSON and compared with the previous results file; any metric
+that got slower than the threshold is reported and makes the script exit
+with status 1.
+
+Example:
+    python benchmark.py                 # all scenarios, compare with bench_results.json
+    python benchmark.py --quick         # only the small scenarios
+    python benchmark.py --only agent-10k array-1m --threshold 0.1
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from model import SickleSim
+
+# population: initial adults (split evenly between genotypes); size: grid width and height;
+# capacity: carrying capacity as a multiple of the population; cull: time only the first
+# step, which culls the population down to capacity, over `repeats` fresh models.
+SCENARIOS = {
+    "agent-1k": dict(mode="agent", population=1000, size=70, capacity=2, steps=50),
+    "agent-10k": dict(mode="agent", population=10000, size=70, capacity=2, steps=20),
+    "agent-10k-grid700": dict(mode="agent", population=10000, size=700, capacity=2, steps=20),
+    "agent-100k": dict(mode="agent", population=100000, size=70, capacity=2, steps=5),
+    "agent-cull-50k": dict(mode="agent", population=50000, size=70, capacity=0.5, cull=True, repeats=3),
+    "array-1k": dict(mode="array", population=1000, size=70, capacity=2, steps=50),
+    "array-100k": dict(mode="array", population=100000, size=70, capacity=2, steps=20),
+    "array-1m": dict(mode="array", population=1000000, size=1000, capacity=2, steps=10),
+    "array-cull-1m": dict(mode="array", population=1000000, size=1000, capacity=0.5, cull=True, repeats=3),
+    "aggregate-1m": dict(mode="aggregate", population=1000000, size=70, capacity=2, steps=200),
+}
+QUICK = ["agent-1k", "agent-10k", "array-1k", "array-100k", "aggregate-1m"]
+
+# Metrics compared against the previous results; larger is worse for all of them.
+METRICS = ["init (s)", "step p50 (ms)", "step p90 (ms)", "peak RSS (MB)"]
+
+
+def make_model(scenario, seed):
+    third = scenario["population"] // 3
+    return SickleSim(
+        height=scenario["size"],
+        width=scenario["size"],
+        initial_normal_adult=third,
+        initial_carrier_adult=third,
+        initial_sickle_adult=scenario["population"] - 2 * third,
+        carrying_capacity=int(scenario["capacity"] * scenario["population"]),
+        mode=scenario["mode"],
+        seed=seed,
+    )
+
+
+def run_scenario(name):
+    """
+    Run one scenario in this process and return its metrics.
+    """
+    scenario = SCENARIOS[name]
+    inits = []
+    steps = []
+    for repeat in range(scenario.get("repeats", 1)):
+        start = time.perf_counter()
+        model = make_model(scenario, seed=repeat)
+        inits.append(time.perf_counter() - start)
+        for i in range(1 if scenario.get("cull") else scenario["steps"]):
+            start = time.perf_counter()
+            model.step()
+            steps.append(time.perf_counter() - start)
+
+    steps = 1000 * np.array(steps)
+    return {
+        "init (s)": min(inits),
+        "step p50 (ms)": float(np.percentile(steps, 50)),
+        "step p90 (ms)": float(np.percentile(steps, 90)),
+        "step p99 (ms)": float(np.percentile(steps, 99)),
+        "step mean (ms)": float(steps.mean()),
+        "peak RSS (MB)": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "agents": model.schedule.get_agent_count(),
+    }
+
+
+def run_isolated(name):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-scenario", name],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def compare(previous, results, threshold):
+    """
+    Print each metric next to its previous value and return the list of
+    (scenario, metric, change) regressions above the threshold.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        print(name)
+        for metric in METRICS:
+            value = metrics[metric]
+            line = "    {:<15} {:>10.3f}".format(metric, value)
+            old = previous.get(name, {}).get(metric)
+            if old:
+                change = (value - old) / old
+                line += "  (was {:.3f}, {:+.1%})".format(old, change)
+                if change > threshold:
+                    line += "  REGRESSION"
+                    regressions.append((name, metric, change))
+            print(line)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SickleSim.")
+    parser.add_argument("--only", nargs="+", choices=sorted(SCENARIOS), help="Scenarios to run.")
+    parser.add_argument("--quick", action="store_true", help="Only run the small scenarios.")
+    parser.add_argument("--out", default="bench_results.json",
+                        help="Results file; the previous results in it are the baseline.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown reported as a regression.")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(args.run_scenario)))
+        sys.exit()
+
+    names = args.only or (QUICK if args.quick else list(SCENARIOS))
+    previous = {}
+    if os.path.exists(args.out):
+        with open(args.out) as f:
+            previous = json.load(f)["results"]
+
+    results = {}
+    for name in names:
+        print("running", name, file=sys.stderr)
+        results[name] = run_isolated(name)
+
+    regressions = compare(previous, results, args.threshold)
+    with open(args.out, "w") as f:
+        json.dump(
+            {"python": platform.python_version(), "machine": platform.machine(),
+             "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": dict(previous, **results)},
+            f, indent=2,
+        )
+    if regressions:
+        print("{} regression(s) above {:.0%}".format(len(regressions), args.threshold))
+        sys.exit(1)
@@ -0,0 +1,191 @@
+"""
+Content-addressed on-disk cache of finished runs.
+
+A run is identified by a hash of its SickleSim parameters (seed included),
+how long it ran and the model code version, so identical runs are only
+computed once however they are started. Each entry holds the run's
+collected time series as compressed columns, plus, for callers that keep
+using the model after a hit (such as the server's fast forward), its final
+checkpoint (see SickleSim.save_checkpoint). The least recently used entries
+are evicted once the cache outgrows its size limit.
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+import mesa
+import numpy as np
+
+DEFAULT_PATH = "result_cache"
+
+_code_version = None
+
+
+def code_version():
+    """
+    Returns a hash of the source of every module of the simulation and of
+    the NumPy and Mesa versions, which decide what a seeded run produces.
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for name in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+            digest.update(os.path.basename(name).encode())
+            with open(name, "rb") as f:
+                digest.update(f.read())
+        digest.update("numpy {} mesa {}".format(np.__version__, mesa.__version__).encode())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def cacheable(model):
+    """
+    Returns True if the run of a model can be cached: it is seeded, has not
+    stepped yet, keeps its data in memory and is not profiled.
+    """
+    return (
+        model.params["seed"] is not None and model.schedule.steps == 0
+        and model.collector_path is None and not model.profiler.enabled
+    )
+
+
+class ResultCache:
+    """
+    A directory of entries named by the key of their run: <key>.series.npz
+    and, if kept, <key>.state.npz. Files are written atomically, and a hit
+    refreshes the modification time the least
+    recently used entries are evicted by.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=1 << 30):
+        """
+        Args:
+            path: Directory of the cache.
+            max_bytes: Largest total size of the entries.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, params, step_count, tolerance=None, window=20):
+        """
+        Returns the key of a run.
+        Args:
+            params: SickleSim parameters, as in model.params.
+            step_count, tolerance, window: As for SickleSim.run_model.
+        """
+        run = {
+            "params": params, "step_count": step_count, "tolerance": tolerance,
+            "window": window if tolerance is not None else None, "code": code_version(),
+        }
+        return hashlib.sha256(json.dumps(run, sort_keys=True).encode()).hexdigest()
+
+    def _file(self, key, kind="series"):
+        return os.path.join(self.path, "{}.{}.npz".format(key, kind))
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def load(self, key, model, need_state=False):
+        """
+        Restore a cached run into a fresh model with the same parameters.
+        If the entry has the final state, the model is left exactly as if it
+        had run. Otherwise only its collected data, death totals and
+        equilibrium are filled in, its population is left as it started,
+        and model.replayed is set.
+        Args:
+            key: Key of the run.
+            model: Model to restore into.
+            need_state: If True, only entries with the final state are hits.
+        Returns:
+            True on a hit, False otherwise.
+        """
+        series = self._file(key)
+        state = self._file(key, "state")
+        try:
+            os.utime(series)
+            if os.path.exists(state):
+                os.utime(state)
+                model.load_state(state)
+                return True
+            if need_state:
+                return False
+            with np.load(series) as f:
+                arrays = dict(f)
+        except FileNotFoundError:
+            # Evicted meanwhile, possibly by another process sharing the cache
+            return False
+        meta = json.loads(arrays.pop("meta").tobytes())
+        for i, name in enumerate(meta["columns"]):
+            model.datacollector.model_vars[name] = arrays["data.{}".format(i)].tolist()
+        model.totalSickleDeaths = meta["totalSickleDeaths"]
+        model.totalMalariaDeaths = meta["totalMalariaDeaths"]
+        model.equilibrium = meta["equilibrium"]
+        model.replayed = True
+        return True
+
+    def save(self, key, model, keep_state=False):
+        """
+        Store the collected data of a finished run, compressed, then evict
+        the least recently used entries until the cache fits in max_bytes.
+        Args:
+            key: Key of the run.
+            model: Model at the end of the run.
+            keep_state: If True, also store the model's final state, for
+                        callers that keep using the model after a hit.
+        """
+        model_vars = model.datacollector.model_vars
+        columns = list(model_vars)
+        arrays = {"data.{}".format(i): np.asarray(model_vars[name]) for i, name in enumerate(columns)}
+        meta = {
+            "columns": columns,
+            "totalSickleDeaths": model.totalSickleDeaths,
+            "totalMalariaDeaths": model.totalMalariaDeaths,
+            "equilibrium": model.equilibrium,
+        }
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+        if keep_state:
+            model.save_checkpoint(self._file(key, "state"))
+        # The series file goes last: it is what marks the entry as present
+        path = self._file(key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries, series and state together,
+        until the cache fits in max_bytes.
+        """
+        entries = {}
+        for name in os.listdir(self.path):
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    continue
+                key = name.split(".")[0]
+                mtime, size, names = entries.get(key, (0, 0, []))
+                entries[key] = (max(mtime, stat.st_mtime), size + stat.st_size, names + [name])
+        total = sum(size for mtime, size, names in entries.values())
+        for mtime, size, names in sorted(entries.values()):
+            if total <= self.max_bytes:
+                break
+            for name in names:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        for name in os.listdir(self.path):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(self.path, name))
@@ -0,0 +1,169 @@
+"""
+Streaming columnar data collection with bounded memory.
+
+ColumnarCollector is a drop-in for Mesa's DataCollector (model reporters
+only). Each step is written into preallocated NumPy column buffers, and full
+buffers are appended to one .npy file per column on disk, so a run of any
+length holds at most one chunk in memory. ColumnarReader memory-maps those
+files for lazy reading.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+HEADER_SIZE = 128  # Fixed .npy header size, so the row count can be rewritten in place
+
+
+def _column_file(name):
+    return "".join(c if c.isalnum() else "_" for c in name.lower()) + ".npy"
+
+
+def _write_npy_header(f, dtype, rows):
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(dtype.str, rows)
+    header = header.ljust(HEADER_SIZE - 11) + "\n"
+    f.seek(0)
+    f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+
+
+class ColumnarReader:
+    """
+    Lazy, memory-mapped access to the columns written by a ColumnarCollector.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "columns.json")) as f:
+            self.files = json.load(f)
+        self.columns = list(self.files)
+
+    def __getitem__(self, name):
+        """
+        Returns a read-only memory map of one column.
+        """
+        return np.load(os.path.join(self.path, self.files[name]), mmap_mode="r")
+
+    def __len__(self):
+        return len(self[self.columns[0]]) if self.columns else 0
+
+    def to_dataframe(self, start=None, stop=None):
+        """
+        Returns rows [start, stop) of all columns as a DataFrame.
+        """
+        rows = slice(start, stop)
+        frame = pd.DataFrame({name: np.array(self[name][rows]) for name in self.columns})
+        frame.index += rows.indices(len(self))[0]
+        return frame
+
+
+class _ColumnView:
+    """
+    Read access to one column across the flushed rows and the current buffer,
+    enough for Mesa's ChartModule (which reads model_vars[name][-1]).
+    """
+
+    def __init__(self, collector, name):
+        self.collector = collector
+        self.name = name
+
+    def __len__(self):
+        return self.collector.rows
+
+    def __getitem__(self, index):
+        collector = self.collector
+        if isinstance(index, slice):
+            return collector.column(self.name)[index]
+        if index < 0:
+            index += collector.rows
+        if not 0 <= index < collector.rows:
+            raise IndexError(index)
+        flushed = collector.rows - collector._buffered
+        if index >= flushed:
+            return collector._buffers[self.name][index - flushed].item()
+        return ColumnarReader(collector.path)[self.name][index].item()
+
+
+class ColumnarCollector:
+    """
+    Collects model level reporters into fixed size column buffers and flushes
+    them in chunks to one .npy file per column under `path`.
+    """
+
+    def __init__(self, model_reporters, path, chunk_size=4096, dtype=np.float64, rows=0):
+        """
+        Args:
+            model_reporters: Dictionary of reporter names and functions of the model.
+            path: Directory to write the columns to; existing columns are replaced.
+            chunk_size: Number of rows buffered in memory before flushing.
+            dtype: Dtype of all columns.
+            rows: Number of rows of existing columns to keep and append to,
+                  when resuming from a checkpoint.
+        """
+        self.model_reporters = dict(model_reporters)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)
+        self.rows = rows
+        self._buffered = 0
+        self._buffers = {name: np.empty(chunk_size, dtype=self.dtype) for name in self.model_reporters}
+        self._files = {name: _column_file(name) for name in self.model_reporters}
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "columns.json"), "w") as f:
+            json.dump(self._files, f)
+        for file in self._files.values():
+            with open(os.path.join(path, file), "r+b" if rows else "wb") as f:
+                f.truncate(HEADER_SIZE + rows * self.dtype.itemsize)
+                _write_npy_header(f, self.dtype, rows)
+
+    @property
+    def model_vars(self):
+        return {name: _ColumnView(self, name) for name in self.model_reporters}
+
+    def collect(self, model):
+        """
+        Collect all the model reporters for the current step.
+        """
+        i = self._buffered
+        for name, reporter in self.model_reporters.items():
+            self._buffers[name][i] = reporter(model)
+        self._buffered += 1
+        self.rows += 1
+        if self._buffered == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Append the buffered rows to the column files.
+        """
+        if not self._buffered:
+            return
+        for name, file in self._files.items():
+            with open(os.path.join(self.path, file), "r+b") as f:
+                f.seek(0, os.SEEK_END)
+                f.write(self._buffers[name][:self._buffered].tobytes())
+                _write_npy_header(f, self.dtype, self.rows)
+        self._buffered = 0
+
+    def column(self, name):
+        """
+        Returns all values of one column, flushed and buffered.
+        """
+        flushed = ColumnarReader(self.path)[name][:self.rows - self._buffered]
+        return np.concatenate([flushed, self._buffers[name][:self._buffered]])
+
+    def reader(self):
+        """
+        Flush and return a lazy reader over everything collected so far.
+        """
+        self.flush()
+        return ColumnarReader(self.path)
+
+    def get_model_vars_dataframe(self):
+        """
+        Create a pandas DataFrame from the model variables.
+        """
+        return self.reader().to_dataframe()
@@ -0,0 +1,180 @@
+"""
+Compartment-count population for fast screening of the sickle cell model.
+
+Only the number of people per genotype and life stage is kept (children also
+by age, so that they mature after the same five steps as in the agent based
+model). Births and deaths use the same rates as SickleSim.step, either as
+expected values (mean-field, deterministic) or drawn as a tau-leap step
+(stochastic). The counts can have a leading replicate axis, so that one step
+advances many independent replicates at once (see ensemble.py).
+"""
+
+import numpy as np
+
+from population import BREEDS, MATURATION
+
+
+class CompartmentPopulation:
+    """
+    Stands in for the scheduler of the agent based model, holding six
+    compartment counts instead of agents.
+    Children are counted per genotype and age in `children` (3 x MATURATION)
+    and adults per genotype in `adults`; genotypes are indexed normal,
+    carrier, sickle. With replicates, both have a leading replicate axis,
+    and counts, numbers to remove and death totals are arrays with one
+    value per replicate.
+    """
+
+    def __init__(self, model, stochastic=True, replicates=None):
+        """
+        Args:
+            model: The SickleSim that owns the population.
+            stochastic: If True, draw integer births and deaths each step
+                        (tau-leaping), otherwise advance the expected values.
+            replicates: Number of replicates, or None for a single population.
+        """
+        self.model = model
+        self.stochastic = stochastic
+        self.steps = 0
+        self.time = 0
+        self.streams = model.rng
+        dtype = np.int64 if stochastic else np.float64
+        shape = () if replicates is None else (replicates,)
+        self.children = np.zeros(shape + (3, MATURATION), dtype=dtype)
+        self.adults = np.zeros(shape + (3,), dtype=dtype)
+
+    def step(self):
+        """
+        Age every child by one step, maturing the oldest into adults.
+        """
+        self.adults += self.children[..., -1]
+        self.children[..., 1:] = self.children[..., :-1]
+        self.children[..., 0] = 0
+        self.steps += 1
+        self.time += 1
+
+    def spawn(self, breed, n, age=0):
+        """
+        Add n people of a breed (to every replicate).
+        Args:
+            breed: Agent class whose genotype and life stage to use.
+            n: Number of people to add.
+            age: Scalar or array of n ages; only used for children.
+        """
+        if n <= 0:
+            return
+        genotype, adult = BREEDS[breed]
+        if adult:
+            self.adults[..., genotype] += n
+        elif np.ndim(age) == 0:
+            self.children[..., genotype, age] += n
+        else:
+            self.children[..., genotype, :] += np.bincount(age, minlength=MATURATION).astype(self.children.dtype)
+
+    def remove_random(self, breed, k):
+        """
+        Remove k people of a breed, or all of them if there are fewer than k.
+        Children are removed across ages at random (stochastic) or in
+        proportion to each age (deterministic).
+        """
+        if not np.any(np.asarray(k) > 0):
+            return
+        genotype, adult = BREEDS[breed]
+        if adult:
+            self.adults[..., genotype] -= np.minimum(k, self.adults[..., genotype]).astype(self.adults.dtype)
+        else:
+            self.children[..., genotype, :] -= self._split(self.children[..., genotype, :], k)
+
+    def advance(self, births, malaria_deaths, sickle_deaths, background_deaths):
+        """
+        Apply one step of births and deaths given their expected numbers, as
+        returned by SickleSim.rates.
+        Returns:
+            The number of malaria deaths and sickle cell deaths applied, and
+            the number of children born.
+        """
+        shape = self.adults.shape[:-1]
+        births = np.stack([np.broadcast_to(b, shape) for b in births], -1).astype(float)
+        # Expected deaths by compartment and cause (malaria, sickle cell, background)
+        causes = np.stack(
+            [np.stack([np.broadcast_to(d, shape) for d in deaths], -1)
+             for deaths in (malaria_deaths, sickle_deaths, background_deaths)],
+            -1,
+        ).astype(float)
+        expected = causes.sum(axis=-1)
+        counts = np.concatenate([self.children.sum(axis=-1), self.adults], axis=-1)
+
+        if self.stochastic:
+            p = np.divide(expected, counts, out=np.zeros(expected.shape), where=counts > 0)
+            deaths = self.streams.deaths.binomial(counts, np.minimum(p, 1))
+            shares = np.divide(causes, expected[..., None], out=np.zeros(causes.shape), where=expected[..., None] > 0)
+            shares[expected == 0, 2] = 1
+            by_cause = self.streams.deaths.multinomial(deaths, shares)
+            born = self.streams.births.poisson(births)
+        else:
+            deaths = np.minimum(expected, counts)
+            scale = np.divide(deaths, expected, out=np.zeros(expected.shape), where=expected > 0)
+            by_cause = causes * scale[..., None]
+            born = births
+
+        self.children -= self._split(self.children, deaths[..., :3])
+        self.adults -= deaths[..., 3:]
+        self.children[..., 0] += born
+
+        malaria, sickle, _ = np.moveaxis(by_cause.sum(axis=-2), -1, 0)
+        return self._value(malaria), self._value(sickle), self._value(born.sum(axis=-1))
+
+    def get_state(self):
+        """
+        Returns the compartment state as (arrays, metadata) for checkpoints.
+        """
+        arrays = {"children": self.children, "adults": self.adults}
+        meta = {"steps": self.steps, "time": self.time}
+        return arrays, meta
+
+    def set_state(self, arrays, meta):
+        """
+        Replace the compartment counts with checkpointed ones.
+        """
+        self.children = np.array(arrays["children"])
+        self.adults = np.array(arrays["adults"])
+        self.steps = meta["steps"]
+        self.time = meta["time"]
+
+    def get_breed_count(self, breed_class):
+        """
+        Returns the current number of people of certain breed.
+        """
+        genotype, adult = BREEDS[breed_class]
+        if adult:
+            return self._value(self.adults[..., genotype])
+        return self._value(self.children[..., genotype, :].sum(axis=-1))
+
+    def get_agent_count(self):
+        """
+        Returns the current number of people.
+        """
+        return self._value(self.children.sum(axis=(-2, -1)) + self.adults.sum(axis=-1))
+
+    @staticmethod
+    def _value(counts):
+        # Plain numbers for a single population, arrays for replicates
+        return counts.item() if counts.ndim == 0 else counts
+
+    def _split(self, counts, k):
+        # Split k removals over the last (age) axis of counts, elementwise
+        # over the leading axes
+        total = counts.sum(axis=-1)
+        if self.stochastic:
+            # Draw age by age without replacement
+            remaining = np.minimum(k, total).astype(counts.dtype)
+            left = total
+            removed = np.zeros_like(counts)
+            for age in range(counts.shape[-1] - 1):
+                left = left - counts[..., age]
+                removed[..., age] = self.streams.deaths.hypergeometric(counts[..., age], left, remaining)
+                remaining = remaining - removed[..., age]
+            removed[..., -1] = remaining
+            return removed
+        share = np.divide(k, total, out=np.zeros(np.shape(total)), where=total > 0)
+        return counts * np.minimum(share, 1)[..., None]
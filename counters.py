@@ -0,0 +1,73 @@
+"""
+Population statistics kept up to date as agents are added and removed.
+"""
+
+from collections import Counter
+
+from agents import CARRIER, SICKLE
+from population import BREEDS
+
+
+class PopulationCounters:
+    """
+    Breed and genotype counts plus age structure, updated incrementally by
+    the scheduler so that every read is O(1) (or O(number of birth cohorts)
+    for age histograms) instead of a scan of the population.
+    Ages are stored by birth step, so aging the population needs no update.
+    """
+
+    def __init__(self):
+        self.breeds = Counter()
+        self.genotypes = [0, 0, 0]
+        self.adults = [0, 0, 0]
+        self.total = 0
+        self._cohorts = [Counter(), Counter(), Counter()]
+
+    def add(self, breed, age, now, n=1):
+        """
+        Count n agents of a breed that have the given age at step `now`.
+        """
+        self._update(breed, now - age, n)
+
+    def remove(self, breed, age, now, n=1):
+        """
+        Stop counting n agents of a breed that have the given age at step `now`.
+        """
+        self._update(breed, now - age, -n)
+
+    def _update(self, breed, birth, delta):
+        genotype, adult = BREEDS[breed]
+        self.breeds[breed] += delta
+        self.genotypes[genotype] += delta
+        self.adults[genotype] += delta * adult
+        self.total += delta
+        cohorts = self._cohorts[genotype]
+        cohorts[birth] += delta
+        if not cohorts[birth]:
+            del cohorts[birth]
+
+    def get_breed_count(self, breed):
+        return self.breeds[breed]
+
+    def allele_frequency(self):
+        """
+        Returns the frequency of the sickle allele over the whole population.
+        """
+        if not self.total:
+            return 0.0
+        return (self.genotypes[CARRIER] + 2 * self.genotypes[SICKLE]) / (2 * self.total)
+
+    def heterozygote_fraction(self):
+        """
+        Returns the fraction of the population that carries one sickle allele.
+        """
+        if not self.total:
+            return 0.0
+        return self.genotypes[CARRIER] / self.total
+
+    def age_histogram(self, genotype, now):
+        """
+        Returns a dict of age -> count for one genotype code at step `now`.
+        """
+        return {now - birth: count for birth, count in sorted(self._cohorts[genotype].items(), reverse=True)}
+
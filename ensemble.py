@@ -0,0 +1,125 @@
+"""
+Many replicates of one SickleSim parameter set, stepped together.
+
+The replicates are compartment models (see compartments.py) whose counts are
+stacked along a leading replicate axis, so one vectorized step advances all
+of them. Instead of one DataCollector per replicate, each step records the
+mean and quantiles of every series across replicates.
+"""
+
+import numpy as np
+import pandas as pd
+
+from agents import AdultCarrier, AdultNormal
+from compartments import CompartmentPopulation
+from model import SickleSim
+
+SERIES = [
+    "Sickle Cell Adults",
+    "Carrier Adults",
+    "Normal Adults",
+    "Sickle Cell Children",
+    "Carrier Children",
+    "Normal Children",
+    "Total Sickle Cell Deaths",
+    "Total Malaria Deaths",
+    "Sickle Allele Frequency",
+]
+
+
+class Ensemble:
+    """
+    R replicates of SickleSim(mode="aggregate") (or "ode" when not
+    stochastic) advanced in lockstep, as one CompartmentPopulation with a
+    replicate axis: children has shape (R, 3, MATURATION) and adults (R, 3),
+    with genotypes indexed normal, carrier, sickle.
+    """
+
+    def __init__(self, replicates=100, stochastic=True, quantiles=(0.05, 0.5, 0.95), seed=None, **params):
+        """
+        Args:
+            replicates: Number of replicates R.
+            stochastic: If True, every replicate draws its own births and
+                        deaths (tau-leaping); otherwise all follow the mean-field.
+            quantiles: Quantiles recorded for every series each step.
+            seed: Seed for the replicates' random number streams.
+            params: SickleSim keyword arguments shared by all replicates.
+        """
+        mode = "aggregate" if stochastic else "ode"
+        self.model = SickleSim(mode=mode, seed=seed, **params)
+        self.replicates = replicates
+        self.stochastic = stochastic
+        self.quantiles = quantiles
+
+        # Every replicate starts from the model's initial population
+        self.population = CompartmentPopulation(self.model, stochastic, replicates)
+        self.population.children[:] = self.model.schedule.children
+        self.population.adults[:] = self.model.schedule.adults
+        self.total_sickle_deaths = np.zeros(replicates)
+        self.total_malaria_deaths = np.zeros(replicates)
+        self._records = []
+
+    @property
+    def steps(self):
+        return self.population.steps
+
+    @property
+    def children(self):
+        return self.population.children
+
+    @property
+    def adults(self):
+        return self.population.adults
+
+    def step(self):
+        """
+        Advance every replicate by one step, following SickleSim.step.
+        """
+        model = self.model
+        population = self.population
+        population.step()
+
+        x = population.children.sum(axis=2)
+        y = population.adults
+        total = x.sum(axis=1) + y.sum(axis=1)
+        growth_rate, y1_del, y2_del = model.crowding(total, y[:, 0], y[:, 1])
+        population.remove_random(AdultNormal, y1_del)
+        population.remove_random(AdultCarrier, y2_del)
+        total = np.minimum(total, model.carrying_capacity)
+
+        rates = model.rates(tuple(x.T) + tuple(population.adults.T), total, growth_rate)
+        malaria, sickle, _ = population.advance(*rates)
+        self.total_malaria_deaths += malaria
+        self.total_sickle_deaths += sickle
+        self._record()
+
+    def _record(self):
+        x = self.children.sum(axis=2)
+        y = self.adults
+        total = x.sum(axis=1) + y.sum(axis=1)
+        alleles = x[:, 1] + y[:, 1] + 2*(x[:, 2] + y[:, 2])
+        frequency = np.divide(alleles, 2*total, out=np.zeros(len(total)), where=total > 0)
+        values = np.stack(
+            [y[:, 2], y[:, 1], y[:, 0], x[:, 2], x[:, 1], x[:, 0],
+             self.total_sickle_deaths, self.total_malaria_deaths, frequency], 1
+        ).astype(float)
+        self._records.append(
+            np.concatenate([values.mean(axis=0)[None], np.quantile(values, self.quantiles, axis=0)])
+        )
+
+    def run(self, step_count=200):
+        """
+        Run all replicates and return the summary time series.
+        """
+        for i in range(step_count):
+            self.step()
+        return self.get_dataframe()
+
+    def get_dataframe(self):
+        """
+        Returns a DataFrame with one row per step and (series, statistic)
+        columns, where statistic is "mean" or a quantile.
+        """
+        columns = pd.MultiIndex.from_product([SERIES, ["mean"] + list(self.quantiles)])
+        records = np.array(self._records).transpose(0, 2, 1).reshape(len(self._records), -1)
+        return pd.DataFrame(records, columns=columns)
@@ -0,0 +1,68 @@
+"""
+Detection of the equilibrium of a running model.
+"""
+
+import numpy as np
+
+from agents import BREED_LIST
+
+
+class EquilibriumDetector:
+    """
+    Keeps the last 2 * window values of the sickle allele frequency and of
+    the fraction of the population in each breed in a ring buffer, updated
+    once per step, and reports convergence once the mean of none of them
+    over the last window steps differs by tolerance or more from its mean
+    over the window before. Comparing means rather than single steps lets
+    stochastic runs, which keep fluctuating, converge too.
+    """
+
+    def __init__(self, window=20, tolerance=1e-3):
+        """
+        Args:
+            window: Number of steps averaged on each side of the comparison.
+            tolerance: Largest change of a mean between consecutive windows
+                       that counts as converged.
+        """
+        self.window = window
+        self.tolerance = tolerance
+        self._values = np.zeros((2 * window, 1 + len(BREED_LIST)))
+        self._filled = 0
+        self.equilibrium = None
+
+    def update(self, model):
+        """
+        Record the current state of a model.
+        Returns:
+            True if the model has converged.
+        """
+        counts = [model.schedule.get_breed_count(breed) for breed in BREED_LIST]
+        total = sum(counts)
+        row = self._values[self._filled % len(self._values)]
+        row[0] = model.allele_frequency()
+        row[1:] = counts
+        if total:
+            row[1:] /= total
+        self._filled += 1
+        if self._filled < len(self._values):
+            return False
+        # Rows of the latest window, oldest first, wrapping around the buffer
+        latest = (np.arange(self.window) + self._filled - self.window) % len(self._values)
+        recent = np.zeros(len(self._values), dtype=bool)
+        recent[latest] = True
+        change = self._values[recent].mean(axis=0) - self._values[~recent].mean(axis=0)
+        if np.abs(change).max() >= self.tolerance:
+            return False
+        self.equilibrium = {
+            "step": model.schedule.steps,
+            "allele_frequency": float(row[0]),
+        }
+        self.equilibrium.update((breed.name, count) for breed, count in zip(BREED_LIST, counts))
+        return True
+
+    @property
+    def frequency(self):
+        """
+        The allele frequency of the latest update.
+        """
+        return self._values[(self._filled - 1) % len(self._values), 0]
@@ -0,0 +1,182 @@
+"""
+Fast forward for the interactive server.
+
+FastForwardServer is a ModularServer that also accepts a "fast_forward"
+message: the model is advanced K steps, or until it reaches equilibrium, on
+a worker thread without rendering the steps in between. The server keeps
+answering the browser meanwhile, sends progress messages, and
+finishes with a single viz_state update holding the final frame and the
+chart history of all the skipped steps. With a result cache, a fast forward
+run before from the same parameters and seed is replayed from it instead.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.escape
+import tornado.ioloop
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler, VisualizationElement
+
+from cache import cacheable
+from equilibrium import EquilibriumDetector
+
+
+class FastForwardControl(VisualizationElement):
+    """
+    The fast forward controls: number of steps, whether to stop once the
+    population reaches equilibrium, a start/cancel button and a progress bar.
+    """
+
+    local_includes = ["FastForwardControl.js"]
+
+    def __init__(self, steps=200):
+        """
+        Args:
+            steps: Number of steps filled in by default.
+        """
+        self.js_code = "elements.push(new FastForwardControl({}));".format(steps)
+
+    def render(self, model):
+        return None
+
+
+class FastForwardSocketHandler(SocketHandler):
+    """
+    A SocketHandler that also handles fast_forward and fast_forward_cancel
+    messages, and ignores stepping and resets while a fast forward runs.
+    """
+
+    def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        application = self.application
+        if msg["type"] == "fast_forward":
+            if not application.fast_forwarding:
+                application.fast_forward(self, int(msg["steps"]), bool(msg.get("until_converged")))
+        elif msg["type"] == "fast_forward_cancel":
+            application.cancel_fast_forward()
+        elif not application.fast_forwarding:
+            super().on_message(message)
+
+
+class FastForwardServer(ModularServer):
+    """
+    A ModularServer with fast forward. Elements with a render_all(model)
+    method (such as visualization.DecimatedChartModule) use it for the
+    final update, so they can send everything since their last update.
+    """
+
+    socket_handler = (r"/ws", FastForwardSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler, ModularServer.static_handler, ModularServer.local_handler]
+
+    def __init__(self, model_cls, visualization_elements, name="Mesa Model", model_params={},
+                 window=20, tolerance=1e-3, progress_interval=0.1, cache=None):
+        """
+        Args:
+            model_cls, visualization_elements, name, model_params: As for ModularServer.
+            window: Number of steps the allele frequency and breed fractions
+                    have to stay within tolerance for a fast forward until
+                    convergence to stop (see equilibrium.py).
+            tolerance: Largest change over the window that counts as converged.
+            progress_interval: Least number of seconds between progress messages.
+            cache: ResultCache that fast forwards of a fresh, seeded model
+                   are replayed from when they are in it, and added to
+                   otherwise; shared with SickleSim.run_model.
+        """
+        super().__init__(model_cls, visualization_elements, name, model_params)
+        self.window = window
+        self.tolerance = tolerance
+        self.progress_interval = progress_interval
+        self.cache = cache
+        self.fast_forwarding = False
+        self._cancel = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def fast_forward(self, socket, steps, until_converged=False):
+        """
+        Start advancing the model on the worker thread and report back to
+        the socket.
+        Args:
+            socket: The SocketHandler that asked for it.
+            steps: Largest number of steps to advance.
+            until_converged: If True, stop as soon as the population has
+                             reached equilibrium.
+        """
+        loop = tornado.ioloop.IOLoop.current()
+        self.fast_forwarding = True
+        self._cancel.clear()
+
+        def progress(done, frequency):
+            loop.add_callback(socket.write_message, {
+                "type": "fast_forward_progress", "done": done, "steps": steps, "frequency": frequency,
+            })
+
+        def finish(future):
+            self.fast_forwarding = False
+            if socket.ws_connection is None:
+                return
+            try:
+                done, converged, state = future.result()
+            except Exception as error:
+                socket.write_message({"type": "fast_forward_done", "steps": 0, "error": repr(error)})
+                raise
+            socket.write_message({"type": "fast_forward_done", "steps": done, "converged": converged})
+            socket.write_message({"type": "viz_state", "data": state})
+
+        def run():
+            done, converged = self.advance(self.model, steps, until_converged, self._cancel, progress)
+            return done, converged, self.render_final(self.model, self.visualization_elements)
+
+        loop.add_future(self._executor.submit(run), finish)
+
+    def cancel_fast_forward(self):
+        """
+        Stop a running fast forward after its current step.
+        """
+        self._cancel.set()
+
+    def advance(self, model, steps, until_converged, cancel, progress):
+        """
+        Advance a model on the calling thread, replaying the run from the
+        cache when it is there.
+        Args:
+            model: Model to advance.
+            steps, until_converged: As for fast_forward.
+            cancel: threading.Event that stops the advance after its current step.
+            progress: Function called with the steps done and the allele
+                      frequency every progress_interval seconds.
+        Returns:
+            (steps done, whether the model converged)
+        """
+        key = None
+        if self.cache is not None and cacheable(model):
+            # The same run as model.run_model(steps, tolerance=..., window=...)
+            key = self.cache.key(model.params, steps, self.tolerance if until_converged else None, self.window)
+            if self.cache.load(key, model, need_state=True):
+                return model.schedule.steps, model.equilibrium is not None
+
+        detector = EquilibriumDetector(self.window, self.tolerance)
+        converged = False
+        last = time.perf_counter()
+        done = 0
+        while done < steps and model.running and not cancel.is_set():
+            model.step()
+            done += 1
+            if detector.update(model) and until_converged:
+                converged = True
+                break
+            now = time.perf_counter()
+            if now - last >= self.progress_interval:
+                progress(done, detector.frequency)
+                last = now
+        if key is not None and (converged or done == steps):
+            model.equilibrium = detector.equilibrium if converged else None
+            self.cache.save(key, model, keep_state=True)
+        return done, converged
+
+    @staticmethod
+    def render_final(model, elements):
+        """
+        Render every element once, with render_all where an element has it.
+        """
+        return [getattr(element, "render_all", element.render)(model) for element in elements]
@@ -0,0 +1,86 @@
+"""
+Mendelian mating between nearby adults.
+
+Adults are bucketed into square blocks of the grid once per step, and each
+mother pairs with a random other adult of her block, so finding all the
+partners is a few array operations however many adults there are. Every
+child then inherits one allele from each parent, drawn in one vectorized
+pass.
+"""
+
+import numpy as np
+
+from agents import SICKLE
+
+
+class PartnerIndex:
+    """
+    Adults sorted by the block of the grid they are in, with, for each of
+    them, where their block starts in that order and how many adults it has.
+    """
+
+    def __init__(self, xs, ys, height, block_size):
+        """
+        Args:
+            xs, ys: Integer arrays of adult positions.
+            height: Height of the grid.
+            block_size: Side of the square blocks, in cells.
+        """
+        columns = -(-height // block_size)
+        blocks = (np.asarray(xs) // block_size) * columns + np.asarray(ys) // block_size
+        self.order = np.argsort(blocks, kind="stable")
+        blocks = blocks[self.order]
+        new = np.diff(blocks, prepend=-1) != 0
+        starts = np.flatnonzero(new)
+        counts = np.diff(np.append(starts, len(blocks)))
+        block = np.cumsum(new) - 1
+        self.start = starts[block]
+        self.count = counts[block]
+
+    def partners(self, chosen, rng):
+        """
+        Returns, for each chosen adult (as a position in self.order), a
+        uniformly random other adult of the same block, or -1 if there is
+        none.
+        Args:
+            chosen: Integer array of positions in self.order.
+            rng: NumPy Generator.
+        """
+        count = self.count[chosen]
+        partner = self.start[chosen] + rng.integers(0, np.maximum(count - 1, 1))
+        # Skip over the chosen adult itself
+        partner += partner >= chosen
+        return np.where(count > 1, partner, -1)
+
+
+def mate(xs, ys, genotypes, births, height, block_size, rng):
+    """
+    Pair mothers with partners from their block and draw their children.
+    As in SickleSim.rates, adults with sickle cell anemia have no children.
+    Args:
+        xs, ys, genotypes: Arrays of the positions and genotype codes of all adults.
+        births: Number of mothers to draw, with replacement.
+        height: Height of the grid.
+        block_size: Side of the blocks partners are found in.
+        rng: NumPy Generator.
+    Returns:
+        (xs, ys, genotypes) arrays of the children, placed with their
+        mothers. Mothers without a partner in their block have no child.
+    """
+    fertile = np.asarray(genotypes) != SICKLE
+    xs = np.asarray(xs)[fertile]
+    ys = np.asarray(ys)[fertile]
+    genotypes = np.asarray(genotypes)[fertile]
+    if births <= 0 or len(genotypes) < 2:
+        return xs[:0], ys[:0], genotypes[:0]
+
+    index = PartnerIndex(xs, ys, height, block_size)
+    mothers = rng.integers(0, len(genotypes), size=births)
+    fathers = index.partners(mothers, rng)
+    paired = fathers >= 0
+    mothers = index.order[mothers[paired]]
+    fathers = index.order[fathers[paired]]
+
+    # Each parent passes on a sickle allele with probability (its sickle alleles) / 2
+    children = rng.binomial(1, genotypes[mothers] / 2) + rng.binomial(1, genotypes[fathers] / 2)
+    return xs[mothers], ys[mothers], children.astype(genotypes.dtype)
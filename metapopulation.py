@@ -0,0 +1,251 @@
+"""
+Metapopulations of linked islands, one worker process per island.
+
+Each island is its own SickleSim with its own parameters (say, a village
+with a higher malaria_prevalence). The islands advance in synchronized
+epochs of a few steps; at the end of an epoch each island sends some of its
+adults to the others. Migrants are only counts per genotype, written to a
+shared-memory matrix rather than pickled agent objects, and the whole
+exchange costs two messages per island and epoch, so the islands run in
+parallel for all but a few microseconds of each epoch.
+
+Example:
+    with Metapopulation([dict(malaria_prevalence=0.2), dict(malaria_prevalence=0.8)]) as islands:
+        islands.run_model(200)
+        data = islands.get_model_vars_dataframe()
+"""
+
+import multiprocessing
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from agents import AdultNormal, AdultCarrier, AdultSickle
+from batch import run_seed
+from model import SickleSim, initial_ages
+
+# Only adults migrate, one count per genotype
+MIGRANT_BREEDS = (AdultNormal, AdultCarrier, AdultSickle)
+
+
+def emigrate(model, fractions):
+    """
+    Remove the adults leaving an island.
+    Args:
+        model: SickleSim of the island.
+        fractions: Array of the fraction of the island's adults moving to
+                   each island (0 for the island itself).
+    Returns:
+        An (islands, 3) int array of emigrants per destination and genotype.
+    """
+    stay = max(1 - fractions.sum(), 0)
+    emigrants = np.zeros((len(fractions), len(MIGRANT_BREEDS)), dtype=np.int64)
+    for genotype, breed in enumerate(MIGRANT_BREEDS):
+        moved = model.rng.migration.multinomial(
+            model.schedule.get_breed_count(breed), np.append(fractions, stay)
+        )
+        emigrants[:, genotype] = moved[:-1]
+        model.delete_from_breed(breed, int(moved[:-1].sum()))
+    return emigrants
+
+
+def immigrate(model, immigrants):
+    """
+    Add the adults arriving on an island, at random positions and with ages
+    drawn as for the initial adults.
+    Args:
+        model: SickleSim of the island.
+        immigrants: Array of the number of arrivals per genotype.
+    """
+    for breed, count in zip(MIGRANT_BREEDS, immigrants.tolist()):
+        if count > 0:
+            model.schedule.spawn(breed, count, initial_ages(model.rng.migration, count))
+
+
+def _island(conn, index, params, fractions, buffer, islands):
+    """
+    Worker process of one island: builds its model, then runs the epochs it
+    is told to over conn until it is told to stop.
+    """
+    try:
+        model = SickleSim(**params)
+        # migrants[source, destination, genotype]; each island only writes its
+        # own row, and only reads its column once every island has written
+        migrants = np.frombuffer(buffer, dtype=np.int64).reshape(islands, islands, len(MIGRANT_BREEDS))
+        sent = 0
+        conn.send(("ready", None))
+        while True:
+            command, argument = conn.recv()
+            if command == "steps":
+                for i in range(argument):
+                    model.step()
+                conn.send(("done", None))
+            elif command == "emigrate":
+                migrants[index] = emigrate(model, fractions)
+                conn.send(("done", None))
+            elif command == "immigrate":
+                immigrate(model, migrants[:, index].sum(axis=0))
+                conn.send(("done", None))
+            elif command == "collect":
+                model_vars = model.datacollector.model_vars
+                rows = {name: values[sent:] for name, values in model_vars.items()}
+                sent = len(next(iter(model_vars.values()))) if model_vars else 0
+                conn.send(("data", rows))
+            elif command == "close":
+                conn.send(("closed", None))
+                return
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+
+
+class Metapopulation:
+    """
+    Several SickleSim islands in their own worker processes, exchanging
+    adult migrants at the end of every epoch.
+    """
+
+    def __init__(self, islands, migration_rate=0.01, epoch_length=10, seed=0, context=None):
+        """
+        Args:
+            islands: List of SickleSim keyword argument dicts, one per island.
+                     Islands without a "seed" get one derived from seed.
+            migration_rate: Fraction of each island's adults leaving it per
+                            epoch, spread evenly over the other islands, or
+                            an (islands, islands) array whose [i, j] entry is
+                            the fraction moving from island i to island j.
+            epoch_length: Number of steps between migrations.
+            seed: Seed the island seeds are derived from.
+            context: multiprocessing context or start method name.
+        """
+        n = len(islands)
+        if np.ndim(migration_rate) == 0:
+            rates = np.full((n, n), migration_rate / max(n - 1, 1))
+        else:
+            rates = np.array(migration_rate, dtype=float)
+            if rates.shape != (n, n):
+                raise ValueError("migration_rate must be a scalar or a {0}x{0} array".format(n))
+        np.fill_diagonal(rates, 0)
+        if (rates < 0).any() or (rates.sum(axis=1) > 1).any():
+            raise ValueError("migration rates must be non-negative and sum to at most 1 per island")
+
+        self.params = [dict(params) for params in islands]
+        for i, params in enumerate(self.params):
+            params.setdefault("seed", run_seed(seed, i))
+        self.migration_rate = rates
+        self.epoch_length = epoch_length
+        self.epochs = 0
+        self.steps = 0
+        self._data = [{} for params in self.params]
+
+        if not isinstance(context, multiprocessing.context.BaseContext):
+            context = multiprocessing.get_context(context)
+        self._buffer = context.RawArray("q", n * n * len(MIGRANT_BREEDS))
+        self._migrants = np.frombuffer(self._buffer, dtype=np.int64).reshape(n, n, len(MIGRANT_BREEDS))
+        self.migrants = np.zeros((n, n), dtype=np.int64)  # Total migrants from island i to island j
+
+        self._connections = []
+        self._processes = []
+        for i, params in enumerate(self.params):
+            conn, child = context.Pipe()
+            process = context.Process(
+                target=_island, args=(child, i, params, rates[i], self._buffer, n), daemon=True
+            )
+            process.start()
+            child.close()
+            self._connections.append(conn)
+            self._processes.append(process)
+        try:
+            self._gather()
+        except RuntimeError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run_model(self, step_count=200):
+        """
+        Run every island for a number of steps, exchanging migrants every
+        epoch_length steps.
+        """
+        done = 0
+        while done < step_count:
+            # A run may stop and resume in the middle of an epoch
+            steps = min(self.epoch_length - self.steps % self.epoch_length, step_count - done)
+            self._broadcast("steps", steps)
+            done += steps
+            self.steps += steps
+            if self.steps % self.epoch_length == 0:
+                # Every island has written its emigrants before any reads its immigrants
+                self._broadcast("emigrate")
+                self._broadcast("immigrate")
+                self.migrants += self._migrants.sum(axis=2)
+                self.epochs += 1
+        self.collect()
+
+    def collect(self):
+        """
+        Fetch the rows collected by the islands since the previous call.
+        """
+        for data, rows in zip(self._data, self._broadcast("collect")):
+            for name, values in rows.items():
+                data.setdefault(name, []).extend(values)
+
+    def get_island_dataframe(self):
+        """
+        Returns the collected data of all islands in one DataFrame, with an
+        "Island" column and the step in a "Step" column.
+        """
+        frames = []
+        for i, data in enumerate(self._data):
+            frame = pd.DataFrame(data)
+            frame.insert(0, "Island", i)
+            frame.insert(1, "Step", np.arange(len(frame)))
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
+
+    def get_model_vars_dataframe(self):
+        """
+        Returns the merged view of the islands' data collectors: every
+        series summed over the islands, one row per step, as
+        DataCollector.get_model_vars_dataframe() would return for the whole
+        metapopulation.
+        """
+        return self.get_island_dataframe().drop(columns="Island").groupby("Step").sum()
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        for conn, process in zip(self._connections, self._processes):
+            if process.is_alive():
+                try:
+                    conn.send(("close", None))
+                    conn.recv()
+                except (EOFError, OSError):
+                    pass
+            process.join()
+            conn.close()
+        self._connections = []
+        self._processes = []
+
+    def _broadcast(self, command, argument=None):
+        for conn in self._connections:
+            conn.send((command, argument))
+        return self._gather()
+
+    def _gather(self):
+        replies = []
+        for i, conn in enumerate(self._connections):
+            try:
+                reply, value = conn.recv()
+            except EOFError:
+                raise RuntimeError("island {} exited".format(i))
+            if reply == "error":
+                raise RuntimeError("island {} failed:\n{}".format(i, value))
+            replies.append(value)
+        return replies
@@ -1,9 +1,40 @@
+import json
+import os
+
+import numpy as np
 from mesa import Model
-from mesa.space import MultiGrid
 from mesa.datacollection import DataCollector
 
-from agents import AdultSickle, AdultNormal, AdultCarrier, ChildNormal, ChildCarrier, ChildSickle
+from agents import AdultSickle, AdultNormal, AdultCarrier, ChildNormal, ChildCarrier, ChildSickle, BREED_LIST
 from schedule import RandomActivationByBreed
+from population import ArrayPopulation, MATURATION
+from compartments import CompartmentPopulation
+from collector import ColumnarCollector
+from profiler import StepProfiler
+from malaria import MalariaField
+from mating import mate
+from equilibrium import EquilibriumDetector
+from cache import ResultCache, cacheable
+from occupancy import SparseGrid
+from streams import RandomStreams
+
+
+def initial_ages(rng, n):
+    """
+    Draw n initial adult ages from a normal distribution with mean 0 and
+    standard deviation 30, kept between 5 and 75 by rejection and rounded.
+    Args:
+        rng: NumPy Generator to draw from.
+        n: Number of ages.
+    Returns:
+        An int array of n ages.
+    """
+    ages = np.empty(0)
+    while len(ages) < n:
+        # About 43% of draws are kept; draw enough for all of them at once in most cases
+        draws = rng.normal(0, 30, size=int(2.5 * (n - len(ages))) + 16)
+        ages = np.concatenate([ages, draws[(draws >= 5) & (draws <= 75)]])
+    return np.round(ages[:n]).astype(np.int64)
 
 
 class SickleSim(Model):
@@ -41,6 +72,16 @@ class SickleSim(Model):
         malaria_prevalence=0.5,
         sickle_cell_deadliness=0.5,
         heterozygous_advantage=0.5,
+        mode="agent",
+        collector_path=None,
+        movement=True,
+        profile=False,
+        spatial_malaria=False,
+        malaria_hotspots=3,
+        malaria_diffusion=0.2,
+        mating=False,
+        mating_block=5,
+        seed=None,
     ):
         """
         Create a new Sickle Cell model with the given parameters.
@@ -51,8 +92,37 @@ class SickleSim(Model):
             malaria_prevalence: Coefficient of malaria prevalence
             sickle_cell_deadliness: Deadliness of sickle cell
             heterozygous_advantage: The amount of selective advantage heterozygotes have
+            mode: "agent" for one Mesa agent per person, "array" to store the
+                  population in NumPy arrays for very large carrying capacities,
+                  "aggregate" to only keep compartment counts with stochastic
+                  births and deaths, or "ode" for the deterministic mean-field
+            collector_path: If given, stream the collected data to .npy columns in
+                            this directory instead of keeping it all in memory
+            movement: If False, people never move, for non-spatial runs
+            profile: If True, time each phase of every step, see model.profiler
+            spatial_malaria: If True, malaria deaths follow a malaria intensity
+                             field over the grid (see malaria.py) instead of
+                             the global rate; "agent" and "array" modes only
+            malaria_hotspots: Number of wetland hotspots of the malaria field
+            malaria_diffusion: Diffusion of the malaria field between cells
+            mating: If True, children come from adults paired with a partner
+                    near them and inherit one allele from each parent (see
+                    mating.py) instead of the mean-field genotype mix; "agent"
+                    and "array" modes only
+            mating_block: Side, in cells, of the blocks partners are found in
+            seed: Seed for the model's random number generator
         """
         super().__init__()
+        self.params = dict(
+            height=height, width=width, initial_normal_adult=initial_normal_adult,
+            initial_sickle_adult=initial_sickle_adult, initial_carrier_adult=initial_carrier_adult,
+            life_expectancy=life_expectancy, carrying_capacity=carrying_capacity, verbose=verbose,
+            malaria_prevalence=malaria_prevalence, sickle_cell_deadliness=sickle_cell_deadliness,
+            heterozygous_advantage=heterozygous_advantage, mode=mode, collector_path=collector_path,
+            movement=movement, profile=profile, spatial_malaria=spatial_malaria,
+            malaria_hotspots=malaria_hotspots, malaria_diffusion=malaria_diffusion, mating=mating,
+            mating_block=mating_block, seed=seed,
+        )
         # Set parameters
         self.height = height
         self.width = width
@@ -65,91 +135,84 @@ class SickleSim(Model):
         self.malaria_prevalence = 2*malaria_prevalence
         self.sickle_cell_deadliness = 2*sickle_cell_deadliness
         self.heterozygous_advantage = 2-2*heterozygous_advantage
-
-        self.schedule = RandomActivationByBreed(self)
-        self.grid = MultiGrid(self.height, self.width, torus=True)
+        self.mode = mode
+        self.movement = movement
+        self.profiler = StepProfiler(enabled=profile)
+        # All randomness of the model comes from these streams; Mesa's
+        # self.random is shared by every model of the class.
+        self.rng = RandomStreams(seed)
+
+        if mode == "array":
+            self.schedule = ArrayPopulation(self)
+            self.grid = None
+        elif mode in ("ode", "aggregate"):
+            self.schedule = CompartmentPopulation(self, stochastic=mode == "aggregate")
+            self.grid = None
+        elif mode == "agent":
+            self.schedule = RandomActivationByBreed(self)
+            self.grid = SparseGrid(self.width, self.height, torus=True)
+        else:
+            raise ValueError("Unknown mode: {}".format(mode))
+        self.malaria = None
+        if spatial_malaria:
+            if mode not in ("agent", "array"):
+                raise ValueError("spatial_malaria needs the agent or array mode")
+            self.malaria = MalariaField(
+                self.width, self.height, self.rng.malaria, hotspots=malaria_hotspots, diffusion=malaria_diffusion
+            )
+        self.mating = mating
+        self.mating_block = mating_block
+        if mating and mode not in ("agent", "array"):
+            raise ValueError("mating needs the agent or array mode")
         self.totalSickleDeaths = 0
         self.totalMalariaDeaths = 0
-        self.datacollector = DataCollector(
-            {
-                "Sickle Cell Adults": lambda m: m.schedule.get_breed_count(AdultSickle),
-                "Carrier Adults": lambda m: m.schedule.get_breed_count(AdultCarrier),
-                "Normal Adults": lambda m: m.schedule.get_breed_count(AdultNormal),
-                "Sickle Cell Children": lambda m: m.schedule.get_breed_count(ChildSickle),
-                "Carrier Children": lambda m: m.schedule.get_breed_count(ChildCarrier),
-                "Normal Children": lambda m: m.schedule.get_breed_count(ChildNormal),
-                "Total Sickle Cell Deaths": lambda m: self.totalSickleDeaths,
-                "Total Malaria Deaths": lambda m: self.totalMalariaDeaths,
-            }
-        )
+        self.equilibrium = None
+        self.replayed = False
+        model_reporters = {
+            "Sickle Cell Adults": lambda m: m.schedule.get_breed_count(AdultSickle),
+            "Carrier Adults": lambda m: m.schedule.get_breed_count(AdultCarrier),
+            "Normal Adults": lambda m: m.schedule.get_breed_count(AdultNormal),
+            "Sickle Cell Children": lambda m: m.schedule.get_breed_count(ChildSickle),
+            "Carrier Children": lambda m: m.schedule.get_breed_count(ChildCarrier),
+            "Normal Children": lambda m: m.schedule.get_breed_count(ChildNormal),
+            "Total Sickle Cell Deaths": lambda m: self.totalSickleDeaths,
+            "Total Malaria Deaths": lambda m: self.totalMalariaDeaths,
+        }
+        self.collector_path = collector_path
+        if collector_path is None:
+            self.datacollector = DataCollector(model_reporters)
+        else:
+            self.datacollector = ColumnarCollector(model_reporters, collector_path)
 
         self.adult_population = initial_normal_adult+initial_carrier_adult+initial_sickle_adult
-        ages = []
-        for i in range(self.adult_population):
-            age = 0
-            while age < 5 or age > 75:
-                age = self.random.gauss(0, 30)
-            ages.append(round(age))
+        ages = initial_ages(self.rng.ages, self.adult_population)
 
         self.initial_normal_child = round(0.1*initial_normal_adult)
         self.initial_carrier_child = round(0.1*initial_carrier_adult)
         self.initial_sickle_child = round(0.1*initial_carrier_adult)
 
-        # Create normal adults
-        for i in range(self.initial_normal_adult):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            genotype = 0.0
-            adult = AdultNormal(self.next_id(), (x, y), self, True, genotype, ages.pop())
-            self.grid.place_agent(adult, (x, y))
-            self.schedule.add(adult)
-        # Create carrier adults:
-        for i in range(self.initial_carrier_adult):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            genotype = 0.5
-            adult = AdultCarrier(self.next_id(), (x, y), self, True, genotype, ages.pop())
-            self.grid.place_agent(adult, (x, y))
-            self.schedule.add(adult)
-
-        # Create carrier adults:
-        for i in range(self.initial_sickle_adult):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            genotype = 1.0
-            adult = AdultSickle(self.next_id(), (x, y), self, True, genotype, ages.pop())
-            self.grid.place_agent(adult, (x, y))
-            self.schedule.add(adult)
-
-        # Create normal adults:
-        for i in range(self.initial_normal_child):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            genotype = 0.0
-            child = ChildNormal(self.next_id(), (x, y), self, True, genotype, self.random.randint(0, 4))
-            self.grid.place_agent(child, (x, y))
-            self.schedule.add(child)
-
-        # Create carrier children:
-        for i in range(self.initial_carrier_child):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            genotype = 0.5
-            child = ChildCarrier(self.next_id(), (x, y), self, True, genotype, self.random.randint(0, 4))
-            self.grid.place_agent(child, (x, y))
-            self.schedule.add(child)
-
-        # Create sickle children:
-        for i in range(self.initial_sickle_child):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            genotype = 1.0
-            child = ChildSickle(self.next_id(), (x, y), self, True, genotype, self.random.randint(0, 4))
-            self.grid.place_agent(child, (x, y))
-            self.schedule.add(child)
+        start = 0
+        for breed, count in ((AdultNormal, self.initial_normal_adult),
+                             (AdultCarrier, self.initial_carrier_adult),
+                             (AdultSickle, self.initial_sickle_adult)):
+            self.schedule.spawn(breed, count, ages[start:start + count])
+            start += count
+        for breed, count in ((ChildNormal, self.initial_normal_child),
+                             (ChildCarrier, self.initial_carrier_child),
+                             (ChildSickle, self.initial_sickle_child)):
+            if mode == "ode":
+                ages = np.arange(count) % MATURATION
+            else:
+                ages = self.rng.ages.integers(0, MATURATION, size=count)
+            self.schedule.spawn(breed, count, ages)
 
     def step(self):
+        profiler = self.profiler
+        if profiler.enabled:
+            profiler.start(self)
         self.schedule.step()
+        if profiler.enabled:
+            profiler.mark("schedule")
 
         x1 = self.schedule.get_breed_count(ChildNormal)
         x2 = self.schedule.get_breed_count(ChildCarrier)
@@ -159,76 +222,85 @@ class SickleSim(Model):
         y3 = self.schedule.get_breed_count(AdultSickle)
         population = x1+x2+x3+y1+y2+y3
 
-        growth_rate = 0.05*(1-(population/self.carrying_capacity))
-        if growth_rate < 0:
-            growth_rate = 0
-
-        if self.schedule.get_agent_count() > self.carrying_capacity:
-            difference = self.schedule.get_agent_count()-self.carrying_capacity
-            y1_del = round((y1/(y1+y2))*difference)
-            y2_del = round((y2/(y1+y2))*difference)
+        growth_rate, y1_del, y2_del = self.crowding(population, y1, y2)
+        growth_rate = float(growth_rate)
+        if population > self.carrying_capacity:
+            y1_del, y2_del = int(y1_del), int(y2_del)
             self.delete_from_breed(AdultNormal, y1_del)
             self.delete_from_breed(AdultCarrier, y2_del)
             population = self.carrying_capacity
             y1 -= y1_del
             y2 -= y2_del
+        if profiler.enabled:
+            profiler.mark("cull")
 
-        dx1 = (((y1 ** 2)+(1/2)*y1*y2+(1/4)*(y2 ** 2))/((y1+y2+y3) ** 2)*growth_rate*population
-               - (0.075 * self.malaria_prevalence * x1))
-        dx2 = (((1/2)*y1*y2+(1/2)*(y2 ** 2))/((y1+y2+y3) ** 2)*growth_rate*population
-               - ((0.0013*self.malaria_prevalence*self.heterozygous_advantage)+0.009*self.sickle_cell_deadliness)*x2)
-        dx3 = ((1/4)*(y2 ** 2))/((y1+y2+y3) ** 2)*growth_rate*population-((0.0013*self.malaria_prevalence
-                * self.heterozygous_advantage+0.3*self.sickle_cell_deadliness)*x3)
-        dy1 = -(0.007+0.003*self.malaria_prevalence)*y1
-        dy2 = -(0.007+0.00007*self.malaria_prevalence*self.heterozygous_advantage+0.002*self.sickle_cell_deadliness)*y2
-        dy3 = -(0.007+0.00007*self.malaria_prevalence*self.heterozygous_advantage+0.4*self.sickle_cell_deadliness)*y3
-
-        self.totalMalariaDeaths += round((0.075 * self.malaria_prevalence * x1)+
-                                   0.0013*self.malaria_prevalence*self.heterozygous_advantage*x2
-                                    +0.0013*self.malaria_prevalence*self.heterozygous_advantage*x3
-                                    +0.003*self.malaria_prevalence*y1
-                                    +0.00007*self.malaria_prevalence*self.heterozygous_advantage*y2
-                                    +0.00007*self.malaria_prevalence*self.heterozygous_advantage*y3)
-
-        self.totalSickleDeaths += round(0.009*self.sickle_cell_deadliness*x2+0.3*self.sickle_cell_deadliness*x3
-                                        + 0.002*self.sickle_cell_deadliness*y2+0.4*self.sickle_cell_deadliness*y3)
-
-        if dx1 < 0:
-            self.delete_from_breed(ChildNormal, abs(round(dx1)))
-        else:
-            for i in range(round(dx1)):
-                x = self.random.randrange(self.width)
-                y = self.random.randrange(self.height)
-                child = ChildNormal(self.next_id(),(x,y),self, True, genotype=0.0, age=0)
-                self.grid.place_agent(child, (x, y))
-                self.schedule.add(child)
-
-        if dx2 < 0:
-            self.delete_from_breed(ChildSickle, abs(round(dx2)))
-        else:
-            for i in range(round(dx2)):
-                x = self.random.randrange(self.width)
-                y = self.random.randrange(self.height)
-                child = ChildCarrier(self.next_id(), (x, y), self, True, genotype=0.5, age=0)
-                self.grid.place_agent(child, (x, y))
-                self.schedule.add(child)
-
-        if dx3 < 0:
-            self.delete_from_breed(ChildSickle, abs(round(dx1)))
-        else:
-            for i in range(round(dx3)):
-                x = self.random.randrange(self.width)
-                y = self.random.randrange(self.height)
-                child = ChildSickle(self.next_id(), (x, y), self, True, genotype=1.0, age=0)
-                self.grid.place_agent(child, (x, y))
-                self.schedule.add(child)
+        births, malaria_deaths, sickle_deaths, background_deaths = self.rates(
+            (x1, x2, x3, y1, y2, y3), population, growth_rate
+        )
 
-        self.delete_from_breed(AdultNormal, abs(round(dy1)))
-        self.delete_from_breed(AdultCarrier, abs(round(dy2)))
-        self.delete_from_breed(AdultSickle, abs(round(dy3)))
+        if profiler.enabled:
+            profiler.mark("rates")
+
+        if self.mode in ("ode", "aggregate"):
+            malaria, sickle, born = self.schedule.advance(births, malaria_deaths, sickle_deaths, background_deaths)
+            self.totalMalariaDeaths += malaria
+            self.totalSickleDeaths += sickle
+            if profiler.enabled:
+                profiler.born(born)
+                profiler.mark("deaths")
+        else:
+            if self.malaria is not None:
+                # Malaria deaths happen where people are exposed rather than
+                # at the global rate
+                self.malaria.step()
+                _, per_capita, _, _ = self.rates((1,) * 6, population, growth_rate)
+                rates = dict(zip(BREED_LIST, per_capita))
+                self.totalMalariaDeaths += self.delete_exposed(rates, self.malaria.exposure())
+                malaria_deaths = (0,) * 6
+                if profiler.enabled:
+                    profiler.mark("deaths")
+
+            if self.mating:
+                # Children are born from actual pairs rather than net of the child deaths
+                self.mate(births, malaria_deaths, sickle_deaths)
+                dx1 = dx2 = dx3 = 0
+            else:
+                dx1, dx2, dx3 = (births[i] - malaria_deaths[i] - sickle_deaths[i] for i in range(3))
+            dy1, dy2, dy3 = (-(background_deaths[i] + malaria_deaths[i] + sickle_deaths[i]) for i in range(3, 6))
+
+            self.totalMalariaDeaths += round(sum(malaria_deaths))
+            self.totalSickleDeaths += round(sum(sickle_deaths))
+
+            # Net births or deaths of children, one genotype at a time. As in
+            # the original model, net carrier deaths remove sickle cell
+            # children, and net sickle cell deaths remove as many as net
+            # normal deaths.
+            for breed, dying, dx, deaths in (
+                (ChildNormal, ChildNormal, dx1, dx1),
+                (ChildCarrier, ChildSickle, dx2, dx2),
+                (ChildSickle, ChildSickle, dx3, dx1),
+            ):
+                if dx < 0:
+                    self.delete_from_breed(dying, abs(round(deaths)))
+                    if profiler.enabled:
+                        profiler.mark("deaths")
+                else:
+                    self.schedule.spawn(breed, round(dx))
+                    if profiler.enabled:
+                        profiler.born(round(dx))
+                        profiler.mark("births")
+
+            self.delete_from_breed(AdultNormal, abs(round(dy1)))
+            self.delete_from_breed(AdultCarrier, abs(round(dy2)))
+            self.delete_from_breed(AdultSickle, abs(round(dy3)))
+            if profiler.enabled:
+                profiler.mark("deaths")
 
         # collect data
         self.datacollector.collect(self)
+        if profiler.enabled:
+            profiler.mark("collect")
+            profiler.end(self)
         if self.verbose:
             print(
                 [
@@ -238,18 +310,270 @@ class SickleSim(Model):
                 ]
             )
 
-    def run_model(self, step_count=200):
+    def mate(self, births, malaria_deaths, sickle_deaths):
+        """
+        Apply the child deaths, then draw as many children as births in
+        total from pairs of nearby adults and place them with their mothers.
+        Mothers with nobody else in their block have no child.
+        Args:
+            births, malaria_deaths, sickle_deaths: Expected counts from self.rates.
+        """
+        profiler = self.profiler
+        for i, breed in enumerate(BREED_LIST[:3]):
+            self.delete_from_breed(breed, round(malaria_deaths[i] + sickle_deaths[i]))
+        xs, ys, genotypes = self.schedule.adults()
+        xs, ys, genotypes = mate(
+            xs, ys, genotypes, round(sum(births)), self.height, self.mating_block, self.rng.births
+        )
+        for breed in BREED_LIST[:3]:
+            child = genotypes == breed.genotype
+            self.schedule.spawn(breed, int(child.sum()), pos=(xs[child], ys[child]))
+        if profiler.enabled:
+            profiler.born(len(genotypes))
+            profiler.mark("births")
+
+    def allele_frequency(self):
+        """
+        Returns the current frequency of the sickle allele, in any mode.
+        """
+        counts = [self.schedule.get_breed_count(breed) for breed in BREED_LIST]
+        total = sum(counts)
+        if not total:
+            return 0.0
+        carriers = counts[1] + counts[4]
+        sickle = counts[2] + counts[5]
+        return (carriers + 2 * sickle) / (2 * total)
+
+    def crowding(self, population, y1, y2):
+        """
+        Logistic growth rate and carrying-capacity cull of a population.
+        Whatever the population holds above the carrying capacity is culled
+        from the normal and carrier adults, in proportion to their numbers.
+        Counts may be arrays, such as one per replicate of an Ensemble.
+        Args:
+            population: Number of people.
+            y1, y2: Numbers of normal and carrier adults.
+        Returns:
+            The growth rate for this step and the numbers of normal and
+            carrier adults to cull.
+        """
+        growth_rate = np.maximum(0.05*(1-(population/self.carrying_capacity)), 0)
+        difference = np.maximum(population - self.carrying_capacity, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            y1_share = np.nan_to_num(np.divide(y1, y1+y2))
+            y2_share = np.nan_to_num(np.divide(y2, y1+y2))
+        y1_del = np.minimum(np.round(y1_share*difference), y1)
+        y2_del = np.minimum(np.round(y2_share*difference), y2)
+        return growth_rate, y1_del, y2_del
+
+    def rates(self, compartments, population, growth_rate):
+        """
+        Expected births and deaths over one step, following Liddell et al.
+        Args:
+            compartments: Counts (x1, x2, x3, y1, y2, y3) of normal, carrier and
+                          sickle children, then normal, carrier and sickle adults.
+            population: Population the births are scaled by.
+            growth_rate: Logistic growth rate for this step.
+        Returns:
+            births for the three child compartments (none without adults),
+            then malaria, sickle cell and background deaths for all six
+            compartments.
+        """
+        x1, x2, x3, y1, y2, y3 = compartments
+        malaria = self.malaria_prevalence
+        deadliness = self.sickle_cell_deadliness
+        advantage = self.heterozygous_advantage
+
+        # Without adults there are no births, rather than a division by zero
+        adults = y1+y2+y3
+        scale = growth_rate*population/(adults ** 2 + (adults == 0))
+        births = (
+            ((y1 ** 2)+(1/2)*y1*y2+(1/4)*(y2 ** 2))*scale,
+            ((1/2)*y1*y2+(1/2)*(y2 ** 2))*scale,
+            ((1/4)*(y2 ** 2))*scale,
+        )
+        malaria_deaths = (
+            0.075*malaria*x1,
+            0.0013*malaria*advantage*x2,
+            0.0013*malaria*advantage*x3,
+            0.003*malaria*y1,
+            0.00007*malaria*advantage*y2,
+            0.00007*malaria*advantage*y3,
+        )
+        sickle_deaths = (
+            0,
+            0.009*deadliness*x2,
+            0.3*deadliness*x3,
+            0,
+            0.002*deadliness*y2,
+            0.4*deadliness*y3,
+        )
+        background_deaths = (0, 0, 0, 0.007*y1, 0.007*y2, 0.007*y3)
+        return births, malaria_deaths, sickle_deaths, background_deaths
 
+    def run_model(self, step_count=200, checkpoint_every=None, checkpoint_path=None, tolerance=None, window=20,
+                  cache=None):
+        """
+        Run the model for a number of steps, or until it reaches equilibrium.
+        Args:
+            step_count: Largest number of steps to run.
+            checkpoint_every: If given, save a checkpoint to checkpoint_path
+                              every this many steps.
+            checkpoint_path: File the checkpoints are written to.
+            tolerance: If given, stop once neither the allele frequency nor
+                       the fraction of any breed changed by tolerance or
+                       more over the last window steps (see equilibrium.py).
+            window: Number of steps the equilibrium has to hold.
+            cache: ResultCache (or its directory). If this run of a fresh,
+                   seeded model is in it, its collected data is restored
+                   instantly (the population only if the entry kept the
+                   final state; see ResultCache.load); otherwise the
+                   finished run's data is added to it.
+        Returns:
+            The equilibrium reached, also kept in self.equilibrium: a dict of
+            its step, allele frequency and breed counts, or None if the run
+            did not converge or tolerance is None.
+        """
+        if (checkpoint_every is None) != (checkpoint_path is None):
+            raise ValueError("checkpoint_every and checkpoint_path must be given together")
+        key = None
+        if cache is not None and cacheable(self):
+            if not isinstance(cache, ResultCache):
+                cache = ResultCache(cache)
+            key = cache.key(self.params, step_count, tolerance, window)
+            if cache.load(key, self):
+                return self.equilibrium
+
+        detector = EquilibriumDetector(window, tolerance) if tolerance is not None else None
+        self.equilibrium = None
         for i in range(step_count):
             self.step()
+            if checkpoint_every and self.schedule.steps % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_path)
+            if detector is not None and detector.update(self):
+                self.equilibrium = detector.equilibrium
+                break
+        if self.collector_path is not None:
+            self.datacollector.flush()
+        if key is not None:
+            cache.save(key, self)
+        return self.equilibrium
+
+    def save_checkpoint(self, path):
+        """
+        Save the full simulation state (population, grid, agent order,
+        random number generator states, death totals and collected data) to
+        a NumPy .npz file. The file is replaced atomically.
+        """
+        arrays, schedule_meta = self.schedule.get_state()
+        arrays = {"schedule." + name: array for name, array in arrays.items()}
+        if self.malaria is not None:
+            arrays.update(("malaria." + name, array) for name, array in self.malaria.get_state().items())
+
+        if self.collector_path is None:
+            columns = list(self.datacollector.model_vars)
+            for i, name in enumerate(columns):
+                arrays["data.{}".format(i)] = np.asarray(self.datacollector.model_vars[name])
+            rows = None
+        else:
+            self.datacollector.flush()
+            columns = list(self.datacollector.model_reporters)
+            rows = self.datacollector.rows
+
+        version, state, gauss = self.random.getstate()
+        meta = {
+            "params": self.params,
+            "schedule": schedule_meta,
+            "random": [version, list(state), gauss],
+            "streams": self.rng.get_state(),
+            "current_id": self.current_id,
+            "running": self.running,
+            "totalSickleDeaths": self.totalSickleDeaths,
+            "totalMalariaDeaths": self.totalMalariaDeaths,
+            "equilibrium": self.equilibrium,
+            "columns": columns,
+            "rows": rows,
+        }
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        """
+        Create a model from a checkpoint written by save_checkpoint.
+        """
+        with np.load(path) as f:
+            params = json.loads(f["meta"].tobytes())["params"]
+        empty = dict(params, initial_normal_adult=0, initial_carrier_adult=0, initial_sickle_adult=0,
+                     collector_path=None)
+        model = cls(**empty)
+        model.params = params
+        model.initial_normal_adult = params["initial_normal_adult"]
+        model.initial_carrier_adult = params["initial_carrier_adult"]
+        model.initial_sickle_adult = params["initial_sickle_adult"]
+        model.load_state(path)
+        return model
+
+    def load_state(self, path):
+        """
+        Replace the state of this model with the one of a checkpoint written
+        by a model with the same parameters.
+        """
+        with np.load(path) as f:
+            arrays = dict(f)
+        meta = json.loads(arrays.pop("meta").tobytes())
+        params = meta["params"]
+        if self.grid is not None:
+            self.grid = SparseGrid(self.width, self.height, torus=True)
+
+        prefix = "schedule."
+        self.schedule.set_state(
+            {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)},
+            meta["schedule"],
+        )
+        if self.malaria is not None:
+            prefix = "malaria."
+            self.malaria.set_state(
+                {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+            )
+        version, state, gauss = meta["random"]
+        self.random.setstate((version, tuple(state), gauss))
+        self.rng.set_state(meta["streams"])
+        self.current_id = meta["current_id"]
+        self.running = meta["running"]
+        self.totalSickleDeaths = meta["totalSickleDeaths"]
+        self.totalMalariaDeaths = meta["totalMalariaDeaths"]
+        self.equilibrium = meta.get("equilibrium")
+
+        if params["collector_path"] is None:
+            for i, name in enumerate(meta["columns"]):
+                self.datacollector.model_vars[name] = arrays["data.{}".format(i)].tolist()
+        else:
+            self.collector_path = params["collector_path"]
+            self.datacollector = ColumnarCollector(
+                self.datacollector.model_reporters, self.collector_path, rows=meta["rows"]
+            )
+
+    def delete_exposed(self, rates, exposure):
+        """
+        Kill each person with probability rate * exposure, from the malaria
+        death rate of their breed and the exposure of their cell, and return
+        how many died.
+        """
+        if self.mode != "agent":
+            return self.schedule.remove_exposed(rates, exposure)
+        removed = self.schedule.remove_exposed(rates, exposure)
+        for agent in removed:
+            self.grid.remove_agent(agent)
+        return len(removed)
 
     def delete_from_breed(self, breed, count):
-        agent_keys = []
-        for i in range(count):
-            if self.schedule.get_breed_count(breed) != 0:
-                agent_key = self.random.choice(list(self.schedule.agents_by_breed[breed].keys()))
-                if agent_key not in agent_keys:
-                    agent = self.schedule.agents_by_breed[breed][agent_key]
-                    self.grid.remove_agent(agent)
-                    self.schedule.remove(agent)
-                    agent_keys.append(agent_key)
+        if self.mode != "agent":
+            self.schedule.remove_random(breed, count)
+            return
+        for agent in self.schedule.remove_random(breed, count):
+            self.grid.remove_agent(agent)
@@ -0,0 +1,214 @@
+"""
+Sparse grid occupancy index for large maps.
+
+Mesa's MultiGrid keeps a list per cell, so its memory grows with width x
+height even when most cells are empty. SparseGrid only stores its agents,
+ordered by cell, together with the sorted ids of the occupied cells and
+CSR-style offsets into that order. The index is rebuilt with a few array
+operations whenever it is needed after a change, which is once per step
+when everybody moves at once.
+"""
+
+import numpy as np
+
+
+class SparseGrid:
+    """
+    A torus of width x height cells holding any number of agents per cell,
+    with the parts of MultiGrid's interface the model and Mesa's CanvasGrid
+    use. Cell (x, y) has id x * height + y.
+    Placing, moving and removing agents only updates their pos (removed
+    agents get pos None) and marks the index stale; bulk moves rebuild it
+    directly from coordinate arrays.
+    """
+
+    def __init__(self, width, height, torus=True):
+        """
+        Args:
+            width, height: Size of the grid.
+            torus: Kept for MultiGrid compatibility; the grid always wraps.
+        """
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self._agents = []  # Ordered by cell once the index is built
+        self._size = 0
+        self._cells = np.zeros(0, dtype=np.int64)  # Sorted ids of the occupied cells
+        self._offsets = np.zeros(1, dtype=np.int64)  # Agents of cell i are _agents[_offsets[i]:_offsets[i + 1]]
+        self._stale = False
+
+    def place_agent(self, agent, pos):
+        """
+        Place an agent on the grid and set its pos.
+        """
+        agent.pos = pos
+        self._agents.append(agent)
+        self._size += 1
+        self._stale = True
+
+    def place_agents(self, agents, xs, ys):
+        """
+        Place many agents at once.
+        Args:
+            agents: List of agents.
+            xs, ys: Sequences of their coordinates.
+        """
+        positions = {}
+        for agent, x, y in zip(agents, xs, ys):
+            pos = (x, y)
+            # Agents on the same cell share one position tuple
+            agent.pos = positions.setdefault(pos, pos)
+        self._agents.extend(agents)
+        self._size += len(agents)
+        self._stale = True
+
+    def remove_agent(self, agent):
+        """
+        Remove an agent from the grid and set its pos to None.
+        """
+        agent.pos = None
+        self._size -= 1
+        self._stale = True
+        # Removed agents stay in _agents until a rebuild; bound them when
+        # nothing else rebuilds the index, as without movement
+        if len(self._agents) > 2 * self._size + 64:
+            self._refresh()
+
+    def move_agent(self, agent, pos):
+        """
+        Move an agent already on the grid to another cell.
+        """
+        agent.pos = pos
+        self._stale = True
+
+    def move_agents(self, agents, xs, ys):
+        """
+        Move every agent on the grid at once and rebuild the index from the
+        new coordinates.
+        Args:
+            agents: List of exactly the agents on the grid, in any order.
+            xs, ys: Integer arrays of their new coordinates.
+        """
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        positions = {}
+        for agent, x, y in zip(agents, xs.tolist(), ys.tolist()):
+            pos = (x, y)
+            agent.pos = positions.setdefault(pos, pos)
+        self._build(list(agents), xs * self.height + ys)
+
+    def get_cell_list_contents(self, cell_list):
+        """
+        Returns the list of agents in the given cells.
+        Args:
+            cell_list: A (x, y) tuple or a list of them.
+        """
+        return list(self.iter_cell_list_contents(cell_list))
+
+    def iter_cell_list_contents(self, cell_list):
+        """
+        Iterates over the agents in the given cells.
+        Args:
+            cell_list: A (x, y) tuple or a list of them.
+        """
+        if isinstance(cell_list, tuple):
+            cell_list = [cell_list]
+        self._refresh()
+        for x, y in cell_list:
+            i = self._find(x * self.height + y)
+            if i is not None:
+                yield from self._agents[self._offsets[i]:self._offsets[i + 1]]
+
+    def is_cell_empty(self, pos):
+        x, y = pos
+        self._refresh()
+        return self._find(x * self.height + y) is None
+
+    def exists_empty_cells(self):
+        self._refresh()
+        return len(self._cells) < self.width * self.height
+
+    def get_neighborhood(self, pos, moore, include_center=False, radius=1):
+        """
+        Returns the cells around pos on the torus.
+        Args:
+            pos: (x, y) of the center.
+            moore: If True, include diagonals; otherwise only cells within
+                   Manhattan distance radius.
+            include_center: If True, include pos itself.
+            radius: Distance of the neighborhood.
+        """
+        x, y = pos
+        cells = []
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if not moore and abs(dx) + abs(dy) > radius:
+                    continue
+                if dx == dy == 0 and not include_center:
+                    continue
+                cell = ((x + dx) % self.width, (y + dy) % self.height)
+                if cell not in cells:
+                    cells.append(cell)
+        return cells
+
+    def cell_counts(self):
+        """
+        Returns (xs, ys, counts) of the occupied cells.
+        """
+        self._refresh()
+        xs, ys = np.divmod(self._cells, self.height)
+        return xs, ys, np.diff(self._offsets)
+
+    def get_cell_counts(self, xs, ys):
+        """
+        Returns the number of agents in each of the given cells.
+        Args:
+            xs, ys: Arrays of cell coordinates.
+        """
+        self._refresh()
+        ids = np.asarray(xs, dtype=np.int64) * self.height + np.asarray(ys, dtype=np.int64)
+        i = np.searchsorted(self._cells, ids)
+        found = i < len(self._cells)
+        found[found] = self._cells[i[found]] == ids[found]
+        counts = np.zeros(len(ids), dtype=np.int64)
+        counts[found] = self._offsets[i[found] + 1] - self._offsets[i[found]]
+        return counts
+
+    def occupancy(self):
+        """
+        Returns a dense (width, height) array of agent counts, for maps
+        small enough to hold one.
+        """
+        xs, ys, counts = self.cell_counts()
+        dense = np.zeros((self.width, self.height), dtype=np.int64)
+        dense[xs, ys] = counts
+        return dense
+
+    def __len__(self):
+        return self._size
+
+    def _find(self, cell):
+        i = np.searchsorted(self._cells, cell)
+        if i < len(self._cells) and self._cells[i] == cell:
+            return i
+        return None
+
+    def _refresh(self):
+        if not self._stale:
+            return
+        agents = [agent for agent in self._agents if agent.pos is not None]
+        if len(agents) > self._size:
+            # An agent removed and placed again before the rebuild
+            agents = list(dict.fromkeys(agents))
+        pos = np.array([agent.pos for agent in agents], dtype=np.int64).reshape(-1, 2)
+        self._build(agents, pos[:, 0] * self.height + pos[:, 1])
+
+    def _build(self, agents, ids):
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        self._agents = [agents[i] for i in order.tolist()]
+        self._size = len(agents)
+        starts = np.flatnonzero(np.diff(ids, prepend=-1))
+        self._cells = ids[starts]
+        self._offsets = np.append(starts, len(ids))
+        self._stale = False
@@ -0,0 +1,232 @@
+"""
+Array-backed population for large runs of the sickle cell model.
+
+Instead of one Mesa Agent per person, the whole population lives in a single
+NumPy structured array and movement, aging, maturation and deaths are done as
+vectorized operations over it.
+"""
+
+import numpy as np
+
+from agents import (
+    AdultSickle, AdultNormal, AdultCarrier, ChildNormal, ChildCarrier, ChildSickle,
+    MATURATION,
+)
+from random_walk import random_walk
+
+POPULATION_DTYPE = np.dtype(
+    [
+        ("genotype", np.int8),
+        ("age", np.int32),
+        ("x", np.int32),
+        ("y", np.int32),
+        ("alive", np.bool_),
+    ]
+)
+
+# Breed -> (genotype code, is adult)
+BREEDS = {
+    breed: (breed.genotype, bool(breed.stage))
+    for breed in (ChildNormal, ChildCarrier, ChildSickle, AdultNormal, AdultCarrier, AdultSickle)
+}
+
+
+class ArrayPopulation:
+    """
+    Stores every person as one row of a structured array (genotype, age, x,
+    y, alive) and stands in for the scheduler of the agent based model: it
+    has step(), get_breed_count() and get_agent_count() so that SickleSim and
+    its DataCollector work the same with either engine.
+    A person is a child while age < MATURATION and an adult afterwards, so
+    maturation needs no bookkeeping beyond aging.
+    """
+
+    def __init__(self, model, moore=True, capacity=1024):
+        """
+        Args:
+            model: The SickleSim that owns the population.
+            moore: If True, people may move in all 8 directions.
+            capacity: Number of rows to preallocate.
+        """
+        self.model = model
+        self.moore = moore
+        self.steps = 0
+        self.time = 0
+        self.streams = model.rng
+        self._data = np.zeros(capacity, dtype=POPULATION_DTYPE)
+        self._size = 0
+        self._dead = 0
+        self._counts = None
+
+    @property
+    def data(self):
+        """
+        View of the rows in use, including dead rows not compacted yet.
+        """
+        return self._data[:self._size]
+
+    def step(self):
+        """
+        Move everyone one cell (unless the model has movement off) and age
+        them by one step.
+        """
+        data = self.data
+        if self.model.movement:
+            data["x"], data["y"] = random_walk(
+                data["x"], data["y"], self.model.width, self.model.height, self.streams.movement, self.moore
+            )
+        data["age"] += 1
+        self._counts = None
+        self.steps += 1
+        self.time += 1
+
+    def spawn(self, breed, n, age=0, pos=None):
+        """
+        Add n people of a breed at uniformly random positions.
+        Args:
+            breed: Agent class whose genotype and life stage to use.
+            n: Number of people to create.
+            age: Scalar or array of n ages.
+            pos: Optional (xs, ys) arrays of n positions to use instead.
+        """
+        if n <= 0:
+            return
+        genotype, _ = BREEDS[breed]
+        self._reserve(n)
+        rows = self._data[self._size:self._size + n]
+        rows["genotype"] = genotype
+        rows["age"] = age
+        if pos is None:
+            placement = self.streams.placement
+            pos = placement.integers(0, self.model.width, size=n), placement.integers(0, self.model.height, size=n)
+        rows["x"], rows["y"] = pos
+        rows["alive"] = True
+        self._size += n
+        self._counts = None
+
+    def remove_random(self, breed, k):
+        """
+        Kill k people of a breed picked uniformly at random, or all of them
+        if there are fewer than k.
+        """
+        if k <= 0:
+            return
+        candidates = np.flatnonzero(self._breed_mask(breed))
+        if k < len(candidates):
+            candidates = self.streams.deaths.choice(candidates, size=k, replace=False)
+        self._data["alive"][candidates] = False
+        self._dead += len(candidates)
+        self._counts = None
+        if self._dead > self._size // 2:
+            self._compact()
+
+    def remove_exposed(self, rates, exposure):
+        """
+        Kill each person with probability rate * exposure, from the rate of
+        their breed and the exposure of their cell, in one pass.
+        Args:
+            rates: Dictionary of breed -> per capita death rate.
+            exposure: (width, height) array of per-cell exposure.
+        Returns:
+            The number of people killed.
+        """
+        by_key = np.zeros(6)
+        for breed, rate in rates.items():
+            genotype, adult = BREEDS[breed]
+            by_key[2 * genotype + adult] = rate
+        data = self.data
+        keys = 2 * data["genotype"].astype(np.intp) + (data["age"] >= MATURATION)
+        probability = by_key[keys] * exposure[data["x"], data["y"]]
+        dying = data["alive"] & (self.streams.deaths.random(len(data)) < probability)
+        killed = int(np.count_nonzero(dying))
+        data["alive"] &= ~dying
+        self._dead += killed
+        self._counts = None
+        if self._dead > self._size // 2:
+            self._compact()
+        return killed
+
+    def adults(self):
+        """
+        Returns (xs, ys, genotypes) arrays of all living adults.
+        """
+        data = self.data
+        adult = data["alive"] & (data["age"] >= MATURATION)
+        return data["x"][adult], data["y"][adult], data["genotype"][adult]
+
+    def positions(self):
+        """
+        Returns (xs, ys, genotypes) arrays of everybody alive.
+        """
+        data = self.data
+        alive = data["alive"]
+        return data["x"][alive], data["y"][alive], data["genotype"][alive]
+
+    def get_state(self):
+        """
+        Returns the population state as (arrays, metadata) for checkpoints.
+        """
+        arrays = {"data": self.data}
+        meta = {
+            "steps": self.steps, "time": self.time, "dead": self._dead,
+            "capacity": len(self._data),
+        }
+        return arrays, meta
+
+    def set_state(self, arrays, meta):
+        """
+        Replace the population with a checkpointed one.
+        """
+        data = arrays["data"]
+        # Restore the spare capacity too, since it decides when rows are compacted
+        self._data = np.zeros(max(meta.get("capacity", 0), len(data)), dtype=POPULATION_DTYPE)
+        self._data[:len(data)] = data
+        self._size = len(data)
+        self._dead = meta["dead"]
+        self._counts = None
+        self.steps = meta["steps"]
+        self.time = meta["time"]
+
+    def get_breed_count(self, breed_class):
+        """
+        Returns the current number of people of certain breed.
+        """
+        genotype, adult = BREEDS[breed_class]
+        return int(self._breed_counts()[2 * genotype + adult])
+
+    def get_agent_count(self):
+        """
+        Returns the current number of living people.
+        """
+        return self._size - self._dead
+
+    def _breed_counts(self):
+        if self._counts is None:
+            data = self.data[self.data["alive"]]
+            keys = 2 * data["genotype"].astype(np.intp) + (data["age"] >= MATURATION)
+            self._counts = np.bincount(keys, minlength=6)
+        return self._counts
+
+    def _breed_mask(self, breed):
+        genotype, adult = BREEDS[breed]
+        data = self.data
+        return data["alive"] & (data["genotype"] == genotype) & ((data["age"] >= MATURATION) == adult)
+
+    def _reserve(self, n):
+        if self._size + n <= len(self._data):
+            return
+        if self._dead:
+            self._compact()
+            if self._size + n <= len(self._data):
+                return
+        capacity = max(2 * len(self._data), self._size + n)
+        data = np.zeros(capacity, dtype=POPULATION_DTYPE)
+        data[:self._size] = self.data
+        self._data = data
+
+    def _compact(self):
+        live = self.data[self.data["alive"]]
+        self._data[:len(live)] = live
+        self._data[len(live):self._size] = 0
+        self._size = len(live)
+        self._dead = 0
@@ -0,0 +1,85 @@
+"""
+Per-phase timing of SickleSim.step.
+"""
+
+import time
+import tracemalloc
+
+import pandas as pd
+
+PHASES = ("schedule", "cull", "rates", "births", "deaths", "collect")
+
+
+class StepProfiler:
+    """
+    Records, for every step, the time spent in each phase of SickleSim.step,
+    the number of people born and removed, and optionally the memory
+    allocated. The model only calls into the profiler when it is enabled, so
+    a disabled profiler costs one attribute check per phase.
+    Like a DataCollector, `model_vars` maps each column to a list of its
+    per-step values, so Mesa's ChartModule can plot it directly.
+    """
+
+    def __init__(self, enabled=False, track_allocations=False):
+        """
+        Args:
+            enabled: Whether to record anything.
+            track_allocations: Also record memory allocated per step with
+                               tracemalloc, which slows the model down a lot.
+        """
+        self.enabled = enabled
+        self.track_allocations = track_allocations and enabled
+        self.model_vars = {name: [] for name in self.columns()}
+        self._row = None
+        self._last = None
+        self._agents = 0
+        if self.track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def columns(self):
+        columns = ["{} (ms)".format(phase) for phase in PHASES] + ["total (ms)", "born", "removed"]
+        if self.track_allocations:
+            columns += ["allocated (KiB)", "peak (KiB)"]
+        return columns
+
+    def start(self, model):
+        """
+        Start recording a step.
+        """
+        self._row = dict.fromkeys(self.columns(), 0)
+        self._agents = model.schedule.get_agent_count()
+        if self.track_allocations:
+            self._memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """
+        Attribute the time since the previous mark to a phase.
+        """
+        now = time.perf_counter()
+        self._row["{} (ms)".format(phase)] += 1000 * (now - self._last)
+        self._last = now
+
+    def born(self, n):
+        self._row["born"] += n
+
+    def end(self, model):
+        """
+        Finish recording a step.
+        """
+        row = self._row
+        row["total (ms)"] = 1000 * (time.perf_counter() - self._start)
+        row["removed"] = self._agents + row["born"] - model.schedule.get_agent_count()
+        if self.track_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            row["allocated (KiB)"] = (current - self._memory) / 1024
+            row["peak (KiB)"] = (peak - self._memory) / 1024
+        for name, value in row.items():
+            self.model_vars[name].append(value)
+
+    def get_dataframe(self):
+        """
+        Returns the per-step metrics as a pandas DataFrame.
+        """
+        return pd.DataFrame(self.model_vars)
@@ -1,40 +1,46 @@
 """
-Generalized behavior for random walking, one grid cell at a time.
+Random walking, one grid cell at a time, for whole populations at once.
 """
 
-from mesa import Agent
+import numpy as np
 
+MOORE_OFFSETS = np.array(
+    [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 0), (0, 1), (1, -1), (1, 0), (1, 1)], dtype=np.int32
+)
+VON_NEUMANN_OFFSETS = np.array([(-1, 0), (0, -1), (0, 0), (0, 1), (1, 0)], dtype=np.int32)
 
-class RandomWalker(Agent):
+
+def random_walk(xs, ys, width, height, rng, moore=True):
     """
-    Class implementing random walker methods in a generalized manner.
-    Not indended to be used on its own, but to inherit its methods to multiple
-    other agents.
+    Step every walker one cell (or stay put) on a torus, all at once.
+    Args:
+        xs, ys: Coordinate arrays of the walkers.
+        width, height: Size of the torus.
+        rng: NumPy Generator to draw the moves from.
+        moore: If True, may move in all 8 directions.
+                Otherwise, only up, down, left, right.
+    Returns:
+        The new coordinate arrays.
     """
+    offsets = MOORE_OFFSETS if moore else VON_NEUMANN_OFFSETS
+    moves = offsets[rng.integers(0, len(offsets), size=len(xs))]
+    return (xs + moves[:, 0]) % width, (ys + moves[:, 1]) % height
 
-    grid = None
-    x = None
-    y = None
-    moore = True
 
-    def __init__(self, unique_id, pos, model, moore=True):
-        """
-        grid: The MultiGrid object in which the agent lives.
-        x: The agent's current x coordinate
-        y: The agent's current y coordinate
+def move_all(grid, agents, rng, moore=True):
+    """
+    Move all agents of a SparseGrid one random step and rebuild its
+    occupancy index in bulk, instead of a get_neighborhood and move_agent
+    call per agent.
+    Args:
+        grid: The SparseGrid holding exactly the given agents.
+        agents: List of all agents on the grid.
+        rng: NumPy Generator to draw the moves from.
         moore: If True, may move in all 8 directions.
-                Otherwise, only up, down, left, right.
-        """
-        super().__init__(unique_id, model)
-        self.pos = pos
-        self.moore = moore
+    """
+    if not agents:
+        return
+    pos = np.array([agent.pos for agent in agents], dtype=np.int32)
+    xs, ys = random_walk(pos[:, 0], pos[:, 1], grid.width, grid.height, rng, moore)
+    grid.move_agents(agents, xs, ys)
 
-    def random_move(self):
-        """
-        Step one cell in any allowable direction.
-        """
-        # Pick the next cell from the adjacent cells.
-        next_moves = self.model.grid.get_neighborhood(self.pos, self.moore, True)
-        next_move = self.random.choice(next_moves)
-        # Now move:
-        self.model.grid.move_agent(self, next_move)
\ No newline at end of file
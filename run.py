@@ -1,4 +1,7 @@
-from server import server
+import sys
 
-server.launch()
+from server import make_server
 
+# python run.py --raster draws the grid as a raster, for large populations, and
+# --sessions gives every browser its own model, stepped off the event loop
+make_server(raster="--raster" in sys.argv, sessions="--sessions" in sys.argv).launch()
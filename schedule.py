@@ -1,20 +1,97 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
 
+import numpy as np
 from mesa.time import RandomActivation
 
+from counters import PopulationCounters
+from agents import ADULT, BREED_LIST, Person
+from population import BREEDS, MATURATION
+from random_walk import move_all
+
+
+class BreedPool:
+    """
+    The agents of one breed, kept in a dense list with a unique_id -> index
+    map so that membership, removal and uniform random picks are all O(1).
+    Removal swaps the last agent into the freed slot.
+    Reads like a dict of unique_id -> agent.
+    """
+
+    def __init__(self):
+        self._agents = []
+        self._index = {}
+
+    def add(self, agent):
+        self._index[agent.unique_id] = len(self._agents)
+        self._agents.append(agent)
+
+    def extend(self, agents):
+        """
+        Add a list of agents in one go, in order.
+        """
+        start = len(self._agents)
+        self._index.update(zip([agent.unique_id for agent in agents], range(start, start + len(agents))))
+        self._agents.extend(agents)
+
+    def remove(self, agent):
+        i = self._index.pop(agent.unique_id)
+        last = self._agents.pop()
+        if last is not agent:
+            self._agents[i] = last
+            self._index[last.unique_id] = i
+
+    def sample(self, rng, k):
+        """
+        Returns k distinct agents of the pool picked uniformly at random, or
+        all of them in random order if there are fewer than k.
+        Args:
+            rng: A NumPy Generator.
+            k: Number of agents to pick.
+        """
+        agents = self._agents
+        picked = rng.choice(len(agents), size=min(k, len(agents)), replace=False)
+        return [agents[i] for i in picked.tolist()]
+
+    def keys(self):
+        return self._index.keys()
+
+    def values(self):
+        return list(self._agents)
+
+    def items(self):
+        return [(agent.unique_id, agent) for agent in self._agents]
+
+    def __getitem__(self, unique_id):
+        return self._agents[self._index[unique_id]]
+
+    def __contains__(self, unique_id):
+        return unique_id in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._agents)
+
 
 class RandomActivationByBreed(RandomActivation):
     """
-    A scheduler which activates each type of agent once per step, in random
-    order, with the order reshuffled every step.
-    This is equivalent to the NetLogo 'ask breed...' and is generally the
-    default behavior for an ABM.
-    Assumes that all agents have a step() method.
+    A scheduler which keeps the agents grouped by breed (see agents.Breed).
+    People have no behaviour of their own, so nobody is activated: a step
+    moves everyone at once and ages the population.
+    Children are also grouped into cohorts by birth step; at the end of each
+    step the cohort reaching MATURATION turns into adults in one go.
     """
 
     def __init__(self, model):
         super().__init__(model)
-        self.agents_by_breed = defaultdict(dict)
+        # A plain dict keeps insertion order too, at half the memory of
+        # Mesa's OrderedDict
+        self._agents = {}
+        self.agents_by_breed = defaultdict(BreedPool)
+        self.streams = model.rng
+        self.counters = PopulationCounters()
+        self.child_cohorts = defaultdict(dict)
 
     def add(self, agent):
         """
@@ -22,51 +99,237 @@ class RandomActivationByBreed(RandomActivation):
         Args:
             agent: An Agent to be added to the schedule.
         """
-
         self._agents[agent.unique_id] = agent
-        agent_class = type(agent)
-        self.agents_by_breed[agent_class][agent.unique_id] = agent
+        breed = agent.breed
+        self.agents_by_breed[breed].add(agent)
+        self.counters.add(breed, agent.age, self.steps)
+        if agent.stage != ADULT:
+            self.child_cohorts[agent.birth][agent.unique_id] = agent
 
     def remove(self, agent):
         """
         Remove all instances of a given agent from the schedule.
         """
-
         del self._agents[agent.unique_id]
 
-        agent_class = type(agent)
-        del self.agents_by_breed[agent_class][agent.unique_id]
+        breed = agent.breed
+        self.agents_by_breed[breed].remove(agent)
+        self.counters.remove(breed, agent.age, self.steps)
+        if agent.stage != ADULT:
+            cohort = self.child_cohorts[agent.birth]
+            del cohort[agent.unique_id]
+            if not cohort:
+                del self.child_cohorts[agent.birth]
+
+    def _mature(self):
+        """
+        Turn the cohort of children born MATURATION steps ago into adults,
+        keeping each agent's identity.
+        """
+        cohort = self.child_cohorts.pop(self.steps - MATURATION, None)
+        if not cohort:
+            return
+        matured = Counter()
+        for agent in cohort.values():
+            breed = agent.breed
+            self.agents_by_breed[breed].remove(agent)
+            agent.mature()
+            self.agents_by_breed[breed.adult_breed].add(agent)
+            matured[breed] += 1
+        for breed, count in matured.items():
+            self.counters.remove(breed, MATURATION, self.steps, count)
+            self.counters.add(breed.adult_breed, MATURATION, self.steps, count)
+
+    def spawn(self, breed, n, age=0, pos=None):
+        """
+        Create n agents of a breed at uniformly random positions and add them
+        to the schedule and the model's grid in bulk.
+        Args:
+            breed: Breed to create; it fixes the genotype and life stage.
+            n: Number of agents to create.
+            age: Scalar or sequence of n ages.
+            pos: Optional (xs, ys) arrays of n positions to use instead.
+        Returns:
+            The list of new agents.
+        """
+        if n <= 0:
+            return []
+        model = self.model
+        first_id = model.current_id + 1
+        model.current_id += n
+        ages = np.broadcast_to(age, n).tolist()
+        if pos is None:
+            pos = self.streams.placement.integers(0, model.width, size=n), \
+                self.streams.placement.integers(0, model.height, size=n)
+        xs = np.asarray(pos[0]).tolist()
+        ys = np.asarray(pos[1]).tolist()
+
+        agents = [
+            Person(first_id + i, None, model, breed.genotype, breed.stage, a)
+            for i, a in zip(range(n), ages)
+        ]
+        model.grid.place_agents(agents, xs, ys)
+        pool = self.agents_by_breed[breed]
+        for agent in agents:
+            self._agents[agent.unique_id] = agent
+            pool.add(agent)
+        if breed.stage != ADULT:
+            for agent in agents:
+                self.child_cohorts[agent.birth][agent.unique_id] = agent
+        for a, count in Counter(ages).items():
+            self.counters.add(breed, a, self.steps, count)
+        return agents
 
-    def step(self, by_breed=True):
+    def remove_random(self, breed, k):
         """
-        Executes the step of each agent breed, one at a time, in random order.
+        Remove k agents of a breed picked uniformly at random, or all of them
+        if there are fewer than k.
         Args:
-            by_breed: If True, run all agents of a single breed before running
-                      the next one.
+            breed: Breed to remove from.
+            k: Number of agents to remove.
+        Returns:
+            The list of removed agents.
         """
-        if by_breed:
-            for agent_class in self.agents_by_breed:
-                self.step_breed(agent_class)
-            self.steps += 1
-            self.time += 1
-        else:
-            super().step()
+        removed = self.agents_by_breed[breed].sample(self.streams.deaths, max(k, 0))
+        for agent in removed:
+            self.remove(agent)
+        return removed
 
-    def step_breed(self, breed):
+    def remove_exposed(self, rates, exposure):
         """
-        Shuffle order and run all agents of a given breed.
+        Remove each agent with probability rate * exposure, from the rate of
+        its breed and the exposure of its cell.
         Args:
-            breed: Class object of the breed to run.
+            rates: Dictionary of breed -> per capita death rate.
+            exposure: (width, height) array of per-cell exposure.
+        Returns:
+            The list of removed agents.
+        """
+        removed = []
+        for breed, rate in rates.items():
+            agents = self.agents_by_breed[breed].values()
+            if not agents:
+                continue
+            pos = np.array([agent.pos for agent in agents], dtype=np.intp)
+            dying = self.streams.deaths.random(len(agents)) < rate * exposure[pos[:, 0], pos[:, 1]]
+            removed += [agents[i] for i in np.flatnonzero(dying).tolist()]
+        for agent in removed:
+            self.remove(agent)
+        return removed
+
+    def step(self):
+        """
+        Move every agent at once (unless the model has movement off), then
+        advance the step and mature the cohort that comes of age.
+        """
+        if self.model.movement:
+            move_all(self.model.grid, list(self._agents.values()), self.streams.movement)
+        self.steps += 1
+        self.time += 1
+        self._mature()
+
+    def adults(self):
+        """
+        Returns (xs, ys, genotypes) arrays of all adults.
+        """
+        agents = [agent for breed in BREED_LIST[3:] for agent in self.agents_by_breed[breed].values()]
+        pos = np.array([agent.pos for agent in agents], dtype=np.int64).reshape(-1, 2)
+        genotypes = np.fromiter((agent.genotype for agent in agents), dtype=np.int8, count=len(agents))
+        return pos[:, 0], pos[:, 1], genotypes
+
+    def positions(self):
+        """
+        Returns (xs, ys, genotypes) arrays of all agents.
+        """
+        agents = list(self._agents.values())
+        pos = np.array([agent.pos for agent in agents], dtype=np.int64).reshape(-1, 2)
+        genotypes = np.fromiter((agent.genotype for agent in agents), dtype=np.int8, count=len(agents))
+        return pos[:, 0], pos[:, 1], genotypes
+
+    def get_state(self):
         """
-        agent_keys = list(self.agents_by_breed[breed].keys())
-        self.model.random.shuffle(agent_keys)
-        for agent_key in agent_keys:
-            self.agents_by_breed[breed][agent_key].step()
+        Returns the scheduler state as (arrays, metadata) for checkpoints.
+        Agents are listed in schedule order, with their position in their
+        breed pool, so random picks from the pools are restored exactly.
+        """
+        agents = list(self._agents.values())
+        codes = {breed: i for i, breed in enumerate(BREEDS)}
+        arrays = {
+            "unique_id": np.array([agent.unique_id for agent in agents], dtype=np.int64),
+            "breed": np.array([codes[agent.breed] for agent in agents], dtype=np.int8),
+            "age": np.array([agent.age for agent in agents], dtype=np.int32),
+            "pos": np.array([agent.pos for agent in agents], dtype=np.int32).reshape(-1, 2),
+            "pool_index": np.array(
+                [self.agents_by_breed[agent.breed]._index[agent.unique_id] for agent in agents], dtype=np.int64
+            ),
+        }
+        # Pools are recreated in the order they were created
+        meta = {
+            "steps": self.steps, "time": self.time,
+            "breed_order": [codes[breed] for breed in self.agents_by_breed],
+        }
+        return arrays, meta
+
+    def set_state(self, arrays, meta):
+        """
+        Replace all agents and the scheduler state with a checkpointed one,
+        placing the agents on the model's (empty) grid.
+        """
+        model = self.model
+        breeds = list(BREEDS)
+        self.steps = meta["steps"]
+        self.time = meta["time"]
+        self.agents_by_breed = defaultdict(BreedPool)
+        self.counters = PopulationCounters()
+        self.child_cohorts = defaultdict(dict)
+
+        # Agents are built one by one, but counted and pooled per breed in bulk
+        unique_ids = arrays["unique_id"]
+        codes = arrays["breed"]
+        ages = arrays["age"]
+        agents = [
+            Person(unique_id, None, model, breeds[code].genotype, breeds[code].stage, age)
+            for unique_id, code, age in zip(unique_ids.tolist(), codes.tolist(), ages.tolist())
+        ]
+        self._agents = dict(zip(unique_ids.tolist(), agents))
+        pos = arrays["pos"]
+        model.grid.place_agents(agents, pos[:, 0].tolist(), pos[:, 1].tolist())
+
+        is_child = np.array([breed.stage != ADULT for breed in breeds])
+        for i in np.flatnonzero(is_child[codes]).tolist():
+            agent = agents[i]
+            self.child_cohorts[agent.birth][agent.unique_id] = agent
+        for code in meta.get("breed_order", range(len(breeds))):
+            breed = breeds[code]
+            members = np.flatnonzero(codes == code)
+            cohort_ages, counts = np.unique(ages[members], return_counts=True)
+            for age, count in zip(cohort_ages.tolist(), counts.tolist()):
+                self.counters.add(breed, age, self.steps, count)
+            members = members[np.argsort(arrays["pool_index"][members])]
+            self.agents_by_breed[breed].extend([agents[i] for i in members.tolist()])
 
     def get_breed_count(self, breed_class):
         """
         Returns the current number of agents of certain breed in the queue.
         """
-        return len(self.agents_by_breed[breed_class].values())
+        return self.counters.get_breed_count(breed_class)
+
+    def allele_frequency(self):
+        """
+        Returns the current frequency of the sickle allele.
+        """
+        return self.counters.allele_frequency()
+
+    def heterozygote_fraction(self):
+        """
+        Returns the current fraction of carriers.
+        """
+        return self.counters.heterozygote_fraction()
+
+    def age_histogram(self, genotype):
+        """
+        Returns a dict of age -> number of agents for a genotype code.
+        """
+        return self.counters.age_histogram(genotype, self.steps)
 
 
@@ -1,9 +1,15 @@
-from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import CanvasGrid, ChartModule
+from mesa.visualization.modules import CanvasGrid
 from mesa.visualization.UserParam import UserSettableParameter
 
-from agents import AdultSickle, AdultNormal, AdultCarrier, ChildSickle, ChildCarrier, ChildNormal
+from agents import ADULT, NORMAL
 from model import SickleSim
+from cache import DEFAULT_PATH, ResultCache
+from fastforward import FastForwardControl, FastForwardServer
+from sessions import SessionServer
+from visualization import DecimatedChartModule, RasterGrid
+
+# Colors indexed by [stage][genotype]
+COLORS = (("#0FFFDE", "#FFD80F", "#C402CF"), ("#16981C", "#CCCF02", "#FF130F"))
 
 
 def sickle_cell_portrayal(agent):
@@ -12,67 +18,46 @@ def sickle_cell_portrayal(agent):
 
     portrayal = {}
 
-    if type(agent) is AdultNormal:
-        portrayal["Shape"] = "circle"
-        portrayal["r"] = 1
-        portrayal["Color"] = "#16981C"
-        portrayal["Layer"] = 1
-        portrayal["Filled"] = "true"
-
-    elif type(agent) is AdultCarrier:
+    if agent.stage == ADULT:
         portrayal["Shape"] = "circle"
         portrayal["r"] = 1
-        portrayal["Color"] = "#CCCF02"
-        portrayal["Layer"] = 2
-        portrayal["Filled"] = "true"
-
-    elif type(agent) is AdultSickle:
-        portrayal["Shape"] = "circle"
-        portrayal["r"] = 1
-        portrayal["Color"] = "#FF130F"
-        portrayal["Layer"] = 2
-        portrayal["Filled"] = "true"
-
-    elif type(agent) is ChildNormal:
+    else:
         portrayal["Shape"] = "rect"
         portrayal["w"] = 1
         portrayal["h"] = 1
-        portrayal["Color"] = "#0FFFDE"
-        portrayal["Layer"] = 1
-        portrayal["Filled"] = "true"
+    portrayal["Color"] = COLORS[agent.stage][agent.genotype]
+    portrayal["Layer"] = 1 if agent.genotype == NORMAL else 2
+    portrayal["Filled"] = "true"
 
-    elif type(agent) is ChildCarrier:
-        portrayal["Shape"] = "rect"
-        portrayal["w"] = 1
-        portrayal["h"] = 1
-        portrayal["Color"] = "#FFD80F"
-        portrayal["Layer"] = 2
-        portrayal["Filled"] = "true"
+    return portrayal
 
-    elif type(agent) is ChildSickle:
-        portrayal["Shape"] = "rect"
-        portrayal["w"] = 1
-        portrayal["h"] = 1
-        portrayal["Color"] = "#C402CF"
-        portrayal["Layer"] = 2
-        portrayal["Filled"] = "true"
 
-    return portrayal
+population_series = [
+    {"Label": "Normal Adults", "Color": "#16981C"}, {"Label": "Carrier Adults", "Color": "#CCCF02"},
+    {"Label": "Sickle Cell Adults", "Color": "#FF130F"}, {"Label": "Normal Children", "Color": "#0FFFDE"},
+    {"Label": "Carrier Children", "Color": "#FFD80F"}, {"Label": "Sickle Cell Children", "Color": "#C402CF"}
+]
 
+death_series = [
+    {"Label": "Total Sickle Cell Deaths", "Color": "#F33006"},
+    {"Label": "Total Malaria Deaths", "Color": "#064AF3"}
+]
+
+profiler_series = [
+    {"Label": "schedule (ms)", "Color": "#16981C"},
+    {"Label": "cull (ms)", "Color": "#CCCF02"},
+    {"Label": "rates (ms)", "Color": "#F39C06"},
+    {"Label": "births (ms)", "Color": "#0FFFDE"},
+    {"Label": "deaths (ms)", "Color": "#FF130F"},
+    {"Label": "collect (ms)", "Color": "#C402CF"},
+    {"Label": "total (ms)", "Color": "#000000"},
+]
 
 grid = CanvasGrid(sickle_cell_portrayal, 70, 70, 700, 700)
-chart_element = ChartModule(
-    [{"Label": "Normal Adults", "Color": "#16981C"}, {"Label": "Carrier Adults", "Color": "#CCCF02"},
-     {"Label": "Sickle Cell Adults", "Color": "#FF130F"}, {"Label": "Normal Children", "Color": "#0FFFDE"},
-     {"Label": "Carrier Children", "Color": "#FFD80F"}, {"Label": "Sickle Cell Children", "Color": "#C402CF"}]
-)
-
-death_count_chart = ChartModule(
-    [
-        {"Label": "Total Sickle Cell Deaths", "Color": "#F33006"},
-        {"Label": "Total Malaria Deaths", "Color": "#064AF3"}
-    ]
-)
+# Charts updated every step, which can also send the history of fast forwarded steps
+chart_element = DecimatedChartModule(population_series, min_interval=0)
+death_count_chart = DecimatedChartModule(death_series, min_interval=0)
+profiler_chart = DecimatedChartModule(profiler_series, data_collector_name="profiler", min_interval=0)
 
 model_params = {
     "initial_normal_adult": UserSettableParameter(
@@ -92,11 +77,53 @@ model_params = {
     ),
     "heterozygous_advantage": UserSettableParameter(
         "slider", "Heterozygous Advantage", value=0.5, min_value=0, max_value=1, step=0.01
-    )
-
+    ),
+    "spatial_malaria": UserSettableParameter("checkbox", "Malaria Hotspots", value=False),
+    "malaria_hotspots": UserSettableParameter(
+        "slider", "Number of Hotspots", value=3, min_value=0, max_value=10, step=1
+    ),
+    "mating": UserSettableParameter("checkbox", "Mating Between Neighbours", value=False),
+    "profile": UserSettableParameter("checkbox", "Profile Step Phases", value=False),
+    "seed": UserSettableParameter("number", "Seed (-1 for a new run on every reset)", value=-1),
 }
 
-server = ModularServer(
-    SickleSim, [grid, chart_element, death_count_chart], "Sickle Cell Selection", model_params
-)
-server.port = 8080
\ No newline at end of file
+
+class InteractiveSickleSim(SickleSim):
+    """
+    SickleSim for the server, whose Seed field can't be left empty: a
+    negative seed draws fresh entropy, so every reset is a new run (and is
+    not cached), while a chosen seed replays the same run.
+    """
+
+    def __init__(self, seed=-1, **params):
+        super().__init__(seed=None if seed is None or seed < 0 else int(seed), **params)
+
+
+def make_server(raster=False, cache_path=DEFAULT_PATH, sessions=False):
+    """
+    Args:
+        raster: If True, draw the grid as a per-cell raster sent as frame
+                diffs and batch chart updates, for large populations.
+        cache_path: Directory of the result cache fast forwards are replayed
+                    from, or None for no cache.
+        sessions: If True, give every browser its own model, stepped in a
+                  pool of worker threads (see sessions.py).
+    """
+    if raster:
+        elements = [
+            FastForwardControl(),
+            RasterGrid(700, 700),
+            DecimatedChartModule(population_series),
+            DecimatedChartModule(death_series),
+            DecimatedChartModule(profiler_series, data_collector_name="profiler"),
+        ]
+    else:
+        elements = [FastForwardControl(), grid, chart_element, death_count_chart, profiler_chart]
+    cache = ResultCache(cache_path) if cache_path is not None else None
+    server_cls = SessionServer if sessions else FastForwardServer
+    server = server_cls(InteractiveSickleSim, elements, "Sickle Cell Selection", model_params, cache=cache)
+    server.port = 8080
+    return server
+
+
+server = make_server()
@@ -0,0 +1,286 @@
+"""
+Multi-session interactive server.
+
+ModularServer keeps one model for every browser and steps it on the Tornado
+event loop, so one user with a large population freezes the page for
+everybody. SessionServer gives each websocket connection its own
+parameters, model and copies of the visualization elements, and runs all
+the model work (building, stepping, fast forwarding, rendering and JSON
+encoding) in a thread pool, so the event loop only routes messages and
+writes replies that are already encoded. A session has at most one job in
+the pool and folds the requests that arrive meanwhile into its next job,
+so a slow model only holds up its own session, and sessions left idle are
+closed to free their model.
+"""
+
+import copy
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.escape
+import tornado.ioloop
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler
+from mesa.visualization.UserParam import UserSettableParameter
+
+from fastforward import FastForwardServer
+
+
+class Session:
+    """
+    The parameters, model and visualization elements of one connection,
+    and the requests waiting for its next job. Requests are only touched on
+    the event loop; jobs get what they need as arguments.
+    """
+
+    def __init__(self, server, socket):
+        self.server = server
+        self.socket = socket
+        self.params = {
+            name: value.value if isinstance(value, UserSettableParameter) else value
+            for name, value in server.model_kwargs.items()
+            if not (isinstance(value, UserSettableParameter) and value.param_type == "static_text")
+        }
+        # Elements keep per-model state, such as the last frame sent
+        self.elements = copy.deepcopy(server.visualization_elements)
+        self.model = None
+        self.closed = False
+        self.last_active = time.monotonic()
+        self.cancel = threading.Event()
+        self._busy = False
+        self._reset = False
+        self._steps = 0
+        self._fast_forward = None
+        self._fast_forwarding = False
+
+    @property
+    def busy(self):
+        """
+        Whether a job of this session is running or queued in the pool.
+        """
+        return self._busy
+
+    def set_param(self, name, value):
+        if name in self.params and name in self.server.user_params:
+            self.params[name] = value
+
+    def request_reset(self):
+        if self._fast_forwarding:
+            return
+        self._reset = True
+        self._steps = 0
+        self._schedule()
+
+    def request_step(self):
+        """
+        Ask for one more step. Steps asked for while a job runs are taken
+        together by the next job, up to server.max_pending_steps, and
+        answered with one update.
+        """
+        if self._fast_forwarding:
+            return
+        self._steps = min(self._steps + 1, self.server.max_pending_steps)
+        self._schedule()
+
+    def request_fast_forward(self, steps, until_converged):
+        if self._fast_forwarding:
+            return
+        self.cancel.clear()
+        self._fast_forwarding = True
+        self._fast_forward = (steps, until_converged)
+        self._schedule()
+
+    def close(self):
+        self.closed = True
+        self.cancel.set()
+        if not self._busy:
+            self.model = None
+
+    def _schedule(self):
+        if self._busy or self.closed:
+            return
+        if self._reset:
+            job = (self._reset_job,)
+            self._reset = False
+        elif self._fast_forward is not None:
+            job = (self._fast_forward_job,) + self._fast_forward
+            self._fast_forward = None
+        elif self._steps:
+            job = (self._step_job, self._steps)
+            self._steps = 0
+        else:
+            return
+        self._busy = True
+        loop = tornado.ioloop.IOLoop.current()
+        if job[0] == self._fast_forward_job:
+            # Progress is reported through the event loop, not the pool thread's own
+            job += (loop,)
+        future = self.server.executor.submit(*job)
+        loop.add_future(future, lambda future: self._finish(future, job[0] == self._fast_forward_job))
+
+    def _finish(self, future, fast_forward):
+        self._busy = False
+        # Idleness counts from the end of the last job, not just the last message
+        self.last_active = time.monotonic()
+        if fast_forward:
+            self._fast_forwarding = False
+        if self.closed:
+            self.model = None
+            return
+        try:
+            messages = future.result()
+        except Exception as error:
+            if fast_forward:
+                self._write(json.dumps({"type": "fast_forward_done", "steps": 0, "error": repr(error)}))
+            raise
+        finally:
+            self._schedule()
+        for message in messages:
+            self._write(message)
+
+    def _write(self, message):
+        if not self.closed and self.socket.ws_connection is not None:
+            self.socket.write_message(message)
+
+    # Jobs, run on the pool; each returns the messages to send
+
+    def _viz_state(self, data=None):
+        if data is None:
+            data = [element.render(self.model) for element in self.elements]
+        return json.dumps({"type": "viz_state", "data": data})
+
+    def _reset_job(self):
+        # Let the old model go before building the new one
+        self.model = None
+        self.model = self.server.model_cls(**self.params)
+        return [self._viz_state()]
+
+    def _step_job(self, steps):
+        if self.model is None:
+            self.model = self.server.model_cls(**self.params)
+        for i in range(steps):
+            if not self.model.running or self.model.schedule.steps >= self.server.max_steps:
+                return [json.dumps({"type": "end"})]
+            self.model.step()
+        return [self._viz_state()]
+
+    def _fast_forward_job(self, steps, until_converged, loop):
+        server = self.server
+        if self.model is None:
+            self.model = server.model_cls(**self.params)
+        steps = max(min(steps, server.max_steps - self.model.schedule.steps), 0)
+
+        def progress(done, frequency):
+            message = json.dumps({
+                "type": "fast_forward_progress", "done": done, "steps": steps, "frequency": frequency,
+            })
+            loop.add_callback(self._write, message)
+
+        done, converged = server.advance(self.model, steps, until_converged, self.cancel, progress)
+        return [
+            json.dumps({"type": "fast_forward_done", "steps": done, "converged": converged}),
+            self._viz_state(server.render_final(self.model, self.elements)),
+        ]
+
+
+class SessionSocketHandler(SocketHandler):
+    """
+    A SocketHandler that hands every message to the session of its connection.
+    """
+
+    def open(self):
+        self.session = self.application.open_session(self)
+        if self.session is None:
+            self.close(1013, "Too many sessions")
+            return
+        super().open()
+
+    def on_close(self):
+        if getattr(self, "session", None) is not None:
+            self.application.close_session(self.session)
+
+    def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        session = self.session
+        session.last_active = time.monotonic()
+        if msg["type"] == "get_step":
+            session.request_step()
+        elif msg["type"] == "reset":
+            session.request_reset()
+        elif msg["type"] == "submit_params":
+            session.set_param(msg["param"], msg["value"])
+        elif msg["type"] == "fast_forward":
+            session.request_fast_forward(int(msg["steps"]), bool(msg.get("until_converged")))
+        elif msg["type"] == "fast_forward_cancel":
+            session.cancel.set()
+        elif self.application.verbose:
+            print("Unexpected message!")
+
+
+class SessionServer(FastForwardServer):
+    """
+    A FastForwardServer with one model per connection, stepped and rendered
+    in a pool of worker threads. Memory per session is bounded by the
+    parameter ranges, max_steps and the single pending job of a session.
+    """
+
+    socket_handler = (r"/ws", SessionSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler, ModularServer.static_handler, ModularServer.local_handler]
+
+    max_steps = 20000
+
+    def __init__(self, model_cls, visualization_elements, name="Mesa Model", model_params={},
+                 workers=4, max_sessions=50, idle_timeout=900, max_pending_steps=2, **kwargs):
+        """
+        Args:
+            model_cls, visualization_elements, name, model_params: As for ModularServer.
+            workers: Number of worker threads shared by all sessions.
+            max_sessions: Largest number of open sessions; further
+                          connections are refused.
+            idle_timeout: Seconds without messages after which a session is closed.
+            max_pending_steps: Most steps a session takes in one job when
+                               requests pile up while its model is busy.
+            kwargs: FastForwardServer keyword arguments.
+        """
+        super().__init__(model_cls, visualization_elements, name, model_params, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_pending_steps = max_pending_steps
+        self.sessions = set()
+        self._evictor = None
+
+    def reset_model(self):
+        # Every session builds its own model
+        self.model = None
+
+    def open_session(self, socket):
+        """
+        Returns a new session for a connection, or None if there are too many.
+        """
+        if self._evictor is None:
+            self._evictor = tornado.ioloop.PeriodicCallback(self.evict_idle, 1000 * self.idle_timeout / 10)
+            self._evictor.start()
+        if len(self.sessions) >= self.max_sessions:
+            self.evict_idle()
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        session = Session(self, socket)
+        self.sessions.add(session)
+        return session
+
+    def close_session(self, session):
+        session.close()
+        self.sessions.discard(session)
+
+    def evict_idle(self):
+        """
+        Close the sessions without messages or running jobs for
+        idle_timeout seconds.
+        """
+        now = time.monotonic()
+        for session in list(self.sessions):
+            if not session.busy and now - session.last_active > self.idle_timeout:
+                self.close_session(session)
+                session.socket.close(1001, "Idle session closed")
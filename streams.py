@@ -0,0 +1,45 @@
+"""
+Seeded random number streams for the model's subsystems.
+"""
+
+import numpy as np
+
+# Streams are spawned in this order, and a spawned stream only depends on its
+# position, so new streams must be appended to keep existing runs reproducible.
+# "activation" is no longer drawn from, since people have no step to activate.
+STREAMS = ("placement", "ages", "movement", "births", "deaths", "activation", "malaria", "migration")
+
+
+class RandomStreams:
+    """
+    One independent NumPy Generator per subsystem, all spawned from a single
+    SeedSequence, so a run is reproducible from one seed and drawing more in
+    one subsystem (say, movement) leaves the draws of the others unchanged.
+    Streams are attributes (streams.movement) or items (streams["movement"]).
+    """
+
+    def __init__(self, seed=None):
+        """
+        Args:
+            seed: Integer seed, or None for fresh entropy (kept in
+                  self.entropy, so such a run can still be repeated).
+        """
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.entropy = self.seed_sequence.entropy
+        for name, child in zip(STREAMS, self.seed_sequence.spawn(len(STREAMS))):
+            setattr(self, name, np.random.default_rng(child))
+
+    def __getitem__(self, name):
+        if name not in STREAMS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get_state(self):
+        """
+        Returns the bit generator state of every stream, for checkpoints.
+        """
+        return {name: self[name].bit_generator.state for name in STREAMS}
+
+    def set_state(self, state):
+        for name, stream_state in state.items():
+            self[name].bit_generator.state = stream_state
@@ -0,0 +1,18 @@
+"""
+Regression checks for SickleSim.
+"""
+
+import pytest
+
+from agents import AdultCarrier, AdultNormal, AdultSickle
+from model import SickleSim
+
+
+@pytest.mark.parametrize("mode", ["aggregate", "ode"])
+def test_adult_extinction(mode):
+    # Sickle cell adults die out within a few steps; after that there are no births
+    model = SickleSim(mode=mode, initial_normal_adult=0, initial_carrier_adult=0, seed=1)
+    model.run_model(60)
+    adults = sum(model.schedule.get_breed_count(breed) for breed in (AdultNormal, AdultCarrier, AdultSickle))
+    assert adults < 1e-6
+    assert model.schedule.get_agent_count() < 1e-6
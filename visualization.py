@@ -0,0 +1,174 @@
+"""
+Visualization elements for large populations.
+
+CanvasGrid sends one portrayal dict per agent every step, which stalls the
+browser with tens of thousands of agents. RasterGrid instead sends one byte
+per cell (the dominant genotype and the number of people there), as a PNG
+key frame or as the cells changed since the previous frame.
+DecimatedChartModule only sends the chart rows not sent yet and redraws the
+chart a few times per second, however fast the model steps.
+"""
+
+import base64
+import json
+import struct
+import zlib
+
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+from mesa.visualization.modules import ChartModule
+
+# Cell value: 0 if empty, else DENSITY_LEVELS * dominant genotype + min(count, DENSITY_LEVELS)
+DENSITY_LEVELS = 85
+
+
+def encode_png(frame):
+    """
+    Encode a 2D uint8 array as an 8-bit grayscale PNG, one pixel per value.
+    Returns:
+        The PNG file as bytes.
+    """
+    height, width = frame.shape
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # Each row starts with filter type 0 (none)
+    rows = np.hstack([np.zeros((height, 1), dtype=np.uint8), frame]).tobytes()
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows, 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+def raster(xs, ys, genotypes, width, height, max_size=700):
+    """
+    Aggregate people into a raster of at most max_size x max_size cells.
+    Args:
+        xs, ys, genotypes: Arrays of the positions and genotype codes of
+                           everybody alive.
+        width, height: Size of the grid.
+        max_size: Largest raster side; larger grids are binned.
+    Returns:
+        A (rows, columns) uint8 array of cell values, with x along columns
+        and the largest y in the first row, as CanvasGrid draws it.
+    """
+    scale = max(-(-width // max_size), -(-height // max_size), 1)
+    columns = -(-width // scale)
+    rows = -(-height // scale)
+    cells = (np.asarray(ys) // scale) * columns + np.asarray(xs) // scale
+    counts = np.bincount(cells * 3 + genotypes, minlength=rows * columns * 3).reshape(rows, columns, 3)
+    total = counts.sum(axis=2)
+    frame = DENSITY_LEVELS * counts.argmax(axis=2) + np.minimum(total, DENSITY_LEVELS)
+    frame[total == 0] = 0
+    return frame[::-1].astype(np.uint8)
+
+
+class RasterGrid(VisualizationElement):
+    """
+    Draws the grid as a raster of per-cell values, sending a PNG key frame
+    first and then only the changed cells, unless so many changed that a
+    new key frame is smaller. A key frame is also sent every keyframe_every
+    frames and whenever the model is reset.
+    """
+
+    local_includes = ["RasterGrid.js"]
+
+    def __init__(self, canvas_width=700, canvas_height=700, max_size=700, keyframe_every=100):
+        """
+        Args:
+            canvas_width, canvas_height: Size of the canvas in pixels.
+            max_size: Largest raster side sent; larger grids are binned.
+            keyframe_every: Frames between forced key frames.
+        """
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.max_size = max_size
+        self.keyframe_every = keyframe_every
+        self._model = None
+        self._frame = None
+        self._frames = 0
+        self.js_code = "elements.push(new RasterGrid({}, {}));".format(canvas_width, canvas_height)
+
+    def render(self, model):
+        if not hasattr(model.schedule, "positions"):
+            return None
+        xs, ys, genotypes = model.schedule.positions()
+        frame = raster(xs, ys, genotypes, model.width, model.height, self.max_size)
+
+        previous = self._frame
+        key = (
+            model is not self._model or previous is None or previous.shape != frame.shape
+            or self._frames % self.keyframe_every == 0
+        )
+        self._model = model
+        self._frame = frame
+        self._frames = 1 if key else self._frames + 1
+        png = encode_png(frame)
+        if not key:
+            changed = np.flatnonzero(frame.ravel() != previous.ravel()).astype("<u4")
+            # 4 bytes of index and 1 of value per changed cell
+            if 5 * len(changed) < len(png):
+                return {
+                    "index": base64.b64encode(changed.tobytes()).decode(),
+                    "values": base64.b64encode(frame.ravel()[changed].tobytes()).decode(),
+                }
+        return {"png": base64.b64encode(png).decode(), "density_levels": DENSITY_LEVELS}
+
+
+class DecimatedChartModule(ChartModule):
+    """
+    A ChartModule that sends only the rows collected since its previous
+    update, and whose chart is redrawn at most once per min_interval
+    seconds, after the last rows received, so it keeps up with the model
+    without redrawing every step. The client also halves the points kept
+    once there are more than max_points.
+    """
+
+    local_includes = ["DecimatedChartModule.js"]
+
+    def __init__(self, series, canvas_height=200, canvas_width=500, data_collector_name="datacollector",
+                 min_interval=0.25, max_points=1000):
+        """
+        Args:
+            series: List of dictionaries with "Label" and "Color", as for ChartModule.
+            canvas_height, canvas_width: Size of the chart.
+            data_collector_name: Model attribute holding the data collector.
+            min_interval: Least number of seconds between redraws.
+            max_points: Points kept per series on the client before halving.
+        """
+        super().__init__(series, canvas_height, canvas_width, data_collector_name)
+        self.min_interval = min_interval
+        self._model = None
+        self._sent = 0
+        self.js_code = "elements.push(new DecimatedChartModule({}, {}, {}, {}, {}));".format(
+            json.dumps(series), canvas_width, canvas_height, max_points, 1000 * min_interval
+        )
+
+    def render(self, model):
+        model_vars = getattr(model, self.data_collector_name).model_vars
+        rows = len(next(iter(model_vars.values()))) if model_vars else 0
+        if model is self._model and rows == self._sent:
+            return None
+        return self.render_all(model)
+
+    def render_all(self, model):
+        """
+        Returns all the rows since the previous update.
+        """
+        model_vars = getattr(model, self.data_collector_name).model_vars
+        rows = len(next(iter(model_vars.values()))) if model_vars else 0
+        if model is not self._model or rows < self._sent:
+            self._model = model
+            self._sent = 0
+
+        data = []
+        for series in self.series:
+            name = series["Label"]
+            values = model_vars[name][self._sent:rows] if name in model_vars else [0] * (rows - self._sent)
+            data.append([float(value) for value in values])
+        start = self._sent
+        self._sent = rows
+        return {"start": start, "series": data}